@@ -0,0 +1,184 @@
+import json
+
+from flask import Blueprint, Response, abort, current_app, jsonify, request, stream_with_context
+
+from models import Venue, Artist
+from queries import (
+  VENUE_COLUMNS, ARTIST_COLUMNS, CATALOG_COLUMNS, catalog_query, filter_shows, find_venues_near, genre_arg,
+  has_genre, near_args, show_window, venue_detail, artist_detail
+)
+import exporter
+import importer
+import matchmaking
+from profiler import query_budget
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Rows fetched per round trip from the server-side cursor, and so the most
+# rows a streaming response holds in memory at once
+STREAM_BATCH_SIZE = 1000
+
+def _json_default(value):
+  if hasattr(value, 'isoformat'):
+    return value.isoformat()
+  raise TypeError('%r is not JSON serializable' % (value,))
+
+
+def _dumps(data):
+  return json.dumps(data, default=_json_default, separators=(',', ':'))
+
+
+def stream_ndjson(query):
+  # Streams a column query as newline-delimited JSON, one object per row,
+  # read through a server-side cursor in STREAM_BATCH_SIZE batches.
+  def generate():
+    rows = query.execution_options(stream_results=True).yield_per(STREAM_BATCH_SIZE)
+    lines = []
+    for row in rows:
+      lines.append(_dumps(row._asdict()))
+      if len(lines) == STREAM_BATCH_SIZE:
+        yield '\n'.join(lines) + '\n'
+        lines = []
+    if lines:
+      yield '\n'.join(lines) + '\n'
+
+  return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def _with_genre(query, column):
+  genre = genre_arg(request.args)
+  return query.filter(has_genre(column, genre)) if genre else query
+
+
+@api.route('/venues')
+def venues():
+  return stream_ndjson(_with_genre(catalog_query('venues'), Venue.genres))
+
+
+@api.route('/artists')
+def artists():
+  return stream_ndjson(_with_genre(catalog_query('artists'), Artist.genres))
+
+
+@api.route('/shows')
+def shows():
+  return stream_ndjson(filter_shows(catalog_query('shows'), **show_window(request.args)))
+
+
+def _detail_response(detail, columns):
+  if detail is None:
+    abort(404)
+  entity = detail.pop('entity')
+  data = {column.key: getattr(entity, column.key) for column in columns}
+  data.update(detail)
+  return current_app.response_class(_dumps(data), mimetype='application/json')
+
+
+@api.route('/venues/near')
+@query_budget(1)
+def venues_near():
+  point = near_args(
+    request.args, current_app.config['NEAR_DEFAULT_RADIUS_KM'], current_app.config['NEAR_MAX_RADIUS_KM']
+  )
+  if point is None:
+    return jsonify({"error": "lat and lon, or a known city and state, are required"}), 400
+  lat, lon, radius = point
+  return jsonify({
+    "lat": lat,
+    "lon": lon,
+    "radius_km": radius,
+    "venues": find_venues_near(lat, lon, radius, limit=current_app.config['NEAR_RESULTS_LIMIT'])
+  })
+
+
+@api.route('/venues/<int:venue_id>')
+@query_budget(1)
+def venue(venue_id):
+  return _detail_response(venue_detail(
+    venue_id,
+    past_limit=current_app.config['PAST_SHOWS_LIMIT'],
+    upcoming_limit=current_app.config['UPCOMING_SHOWS_LIMIT']
+  ), VENUE_COLUMNS)
+
+
+@api.route('/artists/<int:artist_id>')
+@query_budget(1)
+def artist(artist_id):
+  return _detail_response(artist_detail(
+    artist_id,
+    past_limit=current_app.config['PAST_SHOWS_LIMIT'],
+    upcoming_limit=current_app.config['UPCOMING_SHOWS_LIMIT']
+  ), ARTIST_COLUMNS)
+
+
+def _recommendations(entity, entity_id):
+  limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+  matches = matchmaking.recommend(entity, entity_id, limit=limit)
+  if matches is None:
+    abort(404)
+  return jsonify(matches)
+
+
+@api.route('/artists/<int:artist_id>/recommended-venues')
+@query_budget(6)
+def recommended_venues(artist_id):
+  return _recommendations(Artist, artist_id)
+
+
+@api.route('/venues/<int:venue_id>/recommended-artists')
+@query_budget(6)
+def recommended_artists(venue_id):
+  return _recommendations(Venue, venue_id)
+
+
+@api.route('/import/<kind>', methods=['POST'])
+def import_records(kind):
+  # Accepts a multipart 'file' upload or the raw request body; the format
+  # comes from ?format=, the file name or the content type.
+  if kind not in importer.KINDS:
+    abort(404)
+  fmt = request.args.get('format')
+  upload = request.files.get('file')
+  if upload is not None:
+    stream, filename = upload.stream, upload.filename
+  else:
+    stream, filename = request.stream, None
+    if fmt is None and request.mimetype in ('application/x-ndjson', 'application/json'):
+      fmt = 'ndjson'
+  if fmt not in (None, 'csv', 'ndjson'):
+    return jsonify({"error": "format must be csv or ndjson"}), 400
+  batch_size = request.args.get('batch_size', '5000')
+  if not batch_size.isdigit() or not 1 <= int(batch_size) <= importer.MAX_BATCH_SIZE:
+    return jsonify({"error": "batch_size must be from 1 to %d" % importer.MAX_BATCH_SIZE}), 400
+  # Multipart uploads are capped by the form parser; a raw body is read
+  # straight from the stream
+  max_length = current_app.config.get('MAX_CONTENT_LENGTH')
+  if max_length is not None and (request.content_length or 0) > max_length:
+    abort(413)
+  report = importer.import_upload(kind, stream, filename=filename, fmt=fmt, batch_size=int(batch_size))
+  return jsonify(report), 422 if report['rejected'] and not report['inserted'] else 200
+
+
+@api.route('/export/<kind>')
+def export(kind):
+  fmt = request.args.get('format', 'csv')
+  if kind not in CATALOG_COLUMNS or fmt not in exporter.FORMATS:
+    abort(404)
+  mimetype, extension = exporter.FORMATS[fmt]
+  try:
+    chunks = exporter.export_rows(kind, fmt)
+  except ImportError:
+    return jsonify({"error": "%s export is not available on this server" % fmt}), 501
+  response = Response(stream_with_context(chunks), mimetype=mimetype)
+  response.headers['Content-Disposition'] = 'attachment; filename=%s.%s' % (kind, extension)
+  return response
+
+
+@api.errorhandler(404)
+def not_found(error):
+  return jsonify({"error": "not found"}), 404
+
+
+@api.errorhandler(413)
+def too_large(error):
+  return jsonify({"error": "request body is over %d bytes" % current_app.config['MAX_CONTENT_LENGTH']}), 413
@@ -2,19 +2,27 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import os
 import sys
 import json
+import functools
+from datetime import date, datetime
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+from babel.dates import parse_pattern
+from jinja2 import FileSystemBytecodeCache
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify, g
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 import logging
-from os import abort
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from database import RoutingSQLAlchemy
+from cache import ResponseCache
+from assets import Assets
+from conditional import conditional
+from profiler import QueryProfiler, query_budget
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -22,8 +30,14 @@ from forms import *
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+if app.config.get('TEMPLATE_BYTECODE_CACHE_DIR'):
+  os.makedirs(app.config['TEMPLATE_BYTECODE_CACHE_DIR'], exist_ok=True)
+  app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['TEMPLATE_BYTECODE_CACHE_DIR'])
+db = RoutingSQLAlchemy(app)
 migrate = Migrate(app,db)
+cache = ResponseCache(app)
+profiler = QueryProfiler(app)
+assets = Assets(app)
 
 
 #----------------------------------------------------------------------------#
@@ -31,19 +45,38 @@ migrate = Migrate(app,db)
 #----------------------------------------------------------------------------#
 
 from models import *
+from queries import *
+from search import search
+import counters
+import scheduling
+import importer
+import exporter
+from api import api
+
+app.register_blueprint(api)
 
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma"
+}
+
+@functools.lru_cache(maxsize=64)
+def datetime_pattern(format, locale):
+  # Compiled Babel pattern and locale, built once per (format, locale)
+  return parse_pattern(DATETIME_FORMATS.get(format, format)), babel.Locale.parse(locale)
+
+parse_datetime = functools.lru_cache(maxsize=4096)(dateutil.parser.parse)
+
+def format_datetime(value, format='medium', locale='en'):
+  if not isinstance(value, datetime):
+    value = parse_datetime(value)
+  pattern, locale = datetime_pattern(format, locale)
+  return pattern.apply(value, locale)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
@@ -56,51 +89,68 @@ def index():
   return render_template('pages/home.html')
 
 
-#  Venues
-#  ----------------------------------------------------------------
+def invalidate_venue(venue_id, artist_ids):
+  # A venue's name and image also appear on /shows and on the pages of the
+  # artists that played there
+  cache.invalidate('venues')
+  cache.invalidate('venues_near')
+  cache.invalidate('shows')
+  cache.invalidate('show_venue', venue_id=venue_id)
+  cache.invalidate('venue_calendar', venue_id=venue_id)
+  for artist_id in artist_ids:
+    cache.invalidate('show_artist', artist_id=artist_id)
+    cache.invalidate('artist_calendar', artist_id=artist_id)
 
-@app.route('/venues')
-def venues():
 
-  venues = Venue.query.all()
-  data=[]
-  
-  venue_places = set()
-  for place in venues:
-    venue_places.add((place.city,place.state))
+@app.route('/metrics/cache')
+def cache_metrics():
+  return jsonify(cache.stats())
 
-  for venue in venue_places:
-    data.append({
-      "city":venue[0],
-      "state":venue[1],
-      "venues":[]
-    })
 
-  for show_place in venues:
-    num_upcoming_shows = 0
+@app.route('/metrics/queries')
+def query_metrics():
+  return jsonify(profiler.stats())
 
-    shows = Show.query.filter_by(venue_id = show_place.id).all()
 
-    for show in shows:
-      if show.start_time > datetime.now():
-        num_upcoming_shows += 1
+@app.route('/metrics/pool')
+def pool_metrics():
+  return jsonify(db.pool_status())
 
-    for input in data:
-      if show_place.city == input['city'] and show_place.state == input['state']:
-        input['venues'].append({
-          "id":show_place.id,
-          "name":show_place.name,
-          "num_upcoming_shows": num_upcoming_shows
-        })
 
-  return render_template('pages/venues.html', areas=data);
+#  Venues
+#  ----------------------------------------------------------------
 
-@app.route('/venues/search', methods=['POST'])
-def search_venues():
+@app.route('/venues')
+@query_budget(2)
+@conditional(venues_version)
+@cache.cached
+def venues():
+  genre = genre_arg(request.args)
+  data = venue_areas(genre)
 
-  search = request.form.get('search_term','')
-  venues = Venue.query.filter(Venue.name.ilike(f'%{search}%')).all()
+  return render_template('pages/venues.html', areas=data, genres=GENRES, genre=genre);
 
+@app.route('/venues/near')
+@query_budget(2)
+@conditional(venues_version)
+@cache.cached
+def venues_near():
+  point = near_args(request.args, app.config['NEAR_DEFAULT_RADIUS_KM'], app.config['NEAR_MAX_RADIUS_KM'])
+  data = find_venues_near(*point, limit=app.config['NEAR_RESULTS_LIMIT']) if point else []
+
+  return render_template('pages/venues_near.html', venues=data, point=point, states=VenueForm.state.kwargs['choices'])
+
+@app.route('/venues/search', methods=['GET', 'POST'])
+@query_budget(3)
+def search_venues():
+
+  search_term = request.values.get('search_term', '')
+  page = request.args.get('page', 1, type=int)
+  count, venues = search(
+    Venue, search_term, page=page,
+    per_page=app.config['SEARCH_RESULTS_PER_PAGE'],
+    max_results=app.config['SEARCH_MAX_RESULTS']
+  )
 
   data = []
 
@@ -108,43 +158,30 @@ def search_venues():
     data.append({
       "id": venue.id,
       "name": venue.name,
-      "num_upcoming_shows": len(db.session.query(Show).filter(Show.venue_id == 1).filter(Show.start_time>datetime.now()).all())
+      "num_upcoming_shows": venue.upcoming_shows_count
     })
 
   response={
-    "count": len(venues),
+    "count": count,
     "data": data
   }
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_venues.html', results=response, search_term=search_term,
+    page=page, pages=-(-count // app.config['SEARCH_RESULTS_PER_PAGE']))
 
 @app.route('/venues/<int:venue_id>')
+@query_budget(2)
+@conditional(venue_version)
+@cache.cached
 def show_venue(venue_id):
-
-
-  venue = Venue.query.filter_by(id=venue_id).first()
-
-  upcoming_shows = db.session.query(Show).join(Artist).filter(Show.venue_id == venue_id).filter(Show.start_time>datetime.now()).all()
-  upcoming_shows_data = []
-
-  past_shows = db.session.query(Show).join(Artist).filter(Show.venue_id == venue_id).filter(Show.start_time<datetime.now()).all()
-  past_shows_data = []
-
-  for show in past_shows:
-    past_shows_data.append({
-      "artist_id": show.artist_id,
-      "artist_name": Artist.query.filter_by(id=show.artist_id).first().name,
-      "image_link":show.artist.image_link,
-      "start_time": show.start_time.strftime("%Y-%m-%d %H:%M:%S")
-    })
-
-  for show in upcoming_shows:
-    upcoming_shows_data.append({
-      "artist_id": show.artist_id,
-      "artist_name": Artist.query.filter_by(id=show.artist_id).first().name,
-      "image_link":show.artist.image_link,
-      "start_time": show.start_time.strftime("%Y-%m-%d %H:%M:%S")
-    })
-
+  detail = venue_detail(
+    venue_id,
+    past_limit=app.config['PAST_SHOWS_LIMIT'],
+    upcoming_limit=app.config['UPCOMING_SHOWS_LIMIT']
+  )
+  if detail is None:
+    abort(404)
+
+  venue = detail['entity']
   data = {
     "id":venue.id,
     "name": venue.name,
@@ -158,14 +195,54 @@ def show_venue(venue_id):
     "seeking_talent": venue.seeking_talent,
     "seeking_description": venue.seeking_description,
     "image_link": venue.image_link,
-    "past_shows":past_shows_data,
-    "upcoming_shows":upcoming_shows_data,
-    "past_shows_count": len(past_shows_data),
-    "upcoming_shows_count":len(upcoming_shows_data)
+    "past_shows": detail['past_shows'],
+    "upcoming_shows": detail['upcoming_shows'],
+    "past_shows_count": detail['past_shows_count'],
+    "upcoming_shows_count": detail['upcoming_shows_count']
   }
 
   return render_template('pages/show_venue.html', venue=data)
 
+
+def calendar_month(view):
+  # Redirects a calendar without ?month=YYYY-MM to the current month, so
+  # cached pages never go stale when the month turns. Runs ahead of
+  # conditional() so the redirect carries no ETag a client could revalidate
+  # into a 304. Months whose grid would run past the years a date can hold
+  # are a 400.
+  @functools.wraps(view)
+  def wrapper(**view_args):
+    if 'month' not in request.args:
+      return redirect(url_for(request.endpoint, month=date.today().strftime('%Y-%m'), **view_args))
+    try:
+      month = datetime.strptime(request.args['month'], '%Y-%m').date()
+    except ValueError:
+      abort(400)
+    if not date.min.year < month.year < date.max.year:
+      abort(400)
+    g.calendar_month = month
+    return view(**view_args)
+  return wrapper
+
+
+def render_calendar(entity, entity_id):
+  # Month calendar page for a venue or artist, for the month calendar_month
+  # picked.
+  name = db.session.query(entity.name).filter(entity.id == entity_id).scalar()
+  if name is None:
+    abort(404)
+  return render_template('pages/calendar.html', kind=entity.__tablename__, entity_id=entity_id, name=name,
+    calendar=month_calendar(entity, entity_id, g.calendar_month))
+
+
+@app.route('/venues/<int:venue_id>/calendar')
+@query_budget(3)
+@calendar_month
+@conditional(venue_version)
+@cache.cached
+def venue_calendar(venue_id):
+  return render_calendar(Venue, venue_id)
+
 #  Create Venue
 #  ----------------------------------------------------------------
 
@@ -195,6 +272,8 @@ def create_venue_submission():
 
     db.session.add(new_venue)
     db.session.commit()
+    cache.invalidate('venues')
+    cache.invalidate('venues_near')
 
     flash('Venue ' + request.form['name'] + ' was successfully listed!')
 
@@ -212,9 +291,13 @@ def delete_venue(venue_id):
   error = False
   try:
     venue = Venue.query.get(venue_id)
+    artist_ids = [artist_id for artist_id, in db.session.query(Show.artist_id).filter_by(venue_id=venue.id).distinct()]
+    counters.remove_venue_shows(venue.id)
     db.session.delete(venue)
     db.session.commit()
 
+    invalidate_venue(venue.id, artist_ids)
+
     flash(f'Your venue {venue_id} has been deleted successfully')
   except:
     error = True
@@ -231,16 +314,29 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@query_budget(2)
+@conditional(artists_version)
+@cache.cached
 def artists():
-  data = db.session.query(Artist).all()
+  genre = genre_arg(request.args)
+  query = db.session.query(Artist)
+  if genre:
+    query = query.filter(has_genre(Artist.genres, genre))
+  data = query.all()
   
-  return render_template('pages/artists.html', artists=data)
+  return render_template('pages/artists.html', artists=data, genres=GENRES, genre=genre)
 
-@app.route('/artists/search', methods=['POST'])
+@app.route('/artists/search', methods=['GET', 'POST'])
+@query_budget(3)
 def search_artists():
 
-  search = request.form.get('search_term','')
-  artists = Artist.query.filter(Artist.name.ilike(f'%{search}')).all()
+  search_term = request.values.get('search_term', '')
+  page = request.args.get('page', 1, type=int)
+  count, artists = search(
+    Artist, search_term, page=page,
+    per_page=app.config['SEARCH_RESULTS_PER_PAGE'],
+    max_results=app.config['SEARCH_MAX_RESULTS']
+  )
 
   data = []
 
@@ -248,41 +344,30 @@ def search_artists():
     data.append({
       "id":artist.id,
       "name":artist.name,
-      "num_upcoming_shows": len(db.session.query(Show).filter(Show.artist_id == 1).filter(Show.start_time>datetime.now()).all())
+      "num_upcoming_shows": artist.upcoming_shows_count
     })
 
   response={
-    "count":len(artists),
+    "count":count,
     "data":data
   }
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_artists.html', results=response, search_term=search_term,
+    page=page, pages=-(-count // app.config['SEARCH_RESULTS_PER_PAGE']))
 
 @app.route('/artists/<int:artist_id>')
+@query_budget(2)
+@conditional(artist_version)
+@cache.cached
 def show_artist(artist_id):
-  artist = Artist.query.filter_by(id=artist_id).first()
-
-  upcoming_shows = db.session.query(Show).join(Venue).filter(Show.artist_id == artist_id).filter(Show.start_time>datetime.now()).all()
-  upcoming_shows_data = []
-
-  past_shows = db.session.query(Show).join(Venue).filter(Show.artist_id == artist_id).filter(Show.start_time<datetime.now()).all()
-  past_shows_data = []
-
-  for show in past_shows:
-    past_shows_data.append({
-      "venue_id": show.venue_id,
-      "venue_name": Venue.query.filter_by(id=show.venue_id).first().name,
-      "image_link":show.venue.image_link,
-      "start_time": show.start_time.strftime("%Y-%m-%d %H:%M:%S")
-    })
-
-  for show in upcoming_shows:
-    upcoming_shows_data.append({
-      "venue_id": show.venue_id,
-      "venue_name": Venue.query.filter_by(id=show.venue_id).first().name,
-      "image_link":show.venue.image_link,
-      "start_time": show.start_time.strftime("%Y-%m-%d %H:%M:%S")
-    })
-
+  detail = artist_detail(
+    artist_id,
+    past_limit=app.config['PAST_SHOWS_LIMIT'],
+    upcoming_limit=app.config['UPCOMING_SHOWS_LIMIT']
+  )
+  if detail is None:
+    abort(404)
+
+  artist = detail['entity']
   data = {
     "id":artist.id,
     "name": artist.name,
@@ -295,16 +380,26 @@ def show_artist(artist_id):
     "seeking_venue": artist.seeking_venue,
     "seeking_description": artist.seeking_description,
     "image_link": artist.image_link,
-    "past_shows":past_shows_data,
-    "upcoming_shows":upcoming_shows_data,
-    "past_shows_count": len(past_shows_data),
-    "upcoming_shows_count":len(upcoming_shows_data)
+    "past_shows": detail['past_shows'],
+    "upcoming_shows": detail['upcoming_shows'],
+    "past_shows_count": detail['past_shows_count'],
+    "upcoming_shows_count": detail['upcoming_shows_count']
   }
   return render_template('pages/show_artist.html', artist=data)
 
+
+@app.route('/artists/<int:artist_id>/calendar')
+@query_budget(3)
+@calendar_month
+@conditional(artist_version)
+@cache.cached
+def artist_calendar(artist_id):
+  return render_calendar(Artist, artist_id)
+
 #  Update
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@query_budget(1)
 def edit_artist(artist_id):
   form = ArtistForm()
   artist = Artist.query.get(artist_id)
@@ -330,6 +425,7 @@ def edit_artist_submission(artist_id):
   return redirect(url_for('show_artist', artist_id=artist_id))
 
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@query_budget(1)
 def edit_venue(venue_id):
   form = VenueForm()
   venue = Venue.query.get(venue_id)
@@ -367,8 +463,15 @@ def edit_venue_submission(venue_id):
     venue.seeking_talent = True if 'seeking_talent' in request.form else False
     venue.seeking_description = request.form['seeking_description']
 
+    # The venue's name and image appear on the pages of its artists
+    Artist.query.filter(
+      Artist.id.in_(db.session.query(Show.artist_id).filter_by(venue_id=venue_id))
+    ).update({Artist.updated_at: datetime.utcnow()}, synchronize_session=False)
+
     db.session.commit()
 
+    invalidate_venue(venue_id, [artist_id for artist_id, in db.session.query(Show.artist_id).filter_by(venue_id=venue_id).distinct()])
+
     flash('Venue ' + request.form['name'] + ' was successfully listed!')
   
   except ValueError:
@@ -409,6 +512,7 @@ def create_artist_submission():
 
     db.session.add(new_artist)
     db.session.commit()
+    cache.invalidate('artists')
 
     flash('Artist ' + request.form['name'] + ' was successfully listed!')
 
@@ -426,22 +530,20 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@query_budget(4)
+@conditional(shows_version)
+@cache.cached
 def shows():
+  filters = {name: request.args[name] for name in SHOW_FILTERS if request.args.get(name)}
+  page = show_page(
+    after=decode_cursor(request.args.get('after')),
+    before=decode_cursor(request.args.get('before')),
+    per_page=app.config['SHOWS_PER_PAGE'],
+    **show_window(request.args)
+  )
 
-  shows = Show.query.all()
-
-  data = []
-
-  for show in shows:
-    data.append({
-      "venue_id": show.venue_id,
-      "venue_name": Venue.query.filter_by(id=show.venue_id).first().name,
-      "artist_id":show.artist_id,
-      "artist_name":Artist.query.filter_by(id=show.artist_id).first().name,
-      "artist_image_link": Artist.query.filter_by(id =show.artist_id).first().image_link,
-      "start_time": show.start_time.strftime("%Y-%m-%d %H:%M:%S")
-    })
-  return render_template('pages/shows.html', shows=data)
+  return render_template('pages/shows.html', shows=page['shows'], prev_cursor=page['prev'], next_cursor=page['next'],
+    filters=filters, genres=GENRES)
 
 @app.route('/shows/create')
 def create_shows():
@@ -456,14 +558,26 @@ def create_show_submission():
   try:
     artist_id = request.form['artist_id']
     venue_id = request.form['venue_id']
-    start_time = request.form['start_time']
-
-    new_show = Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time)
+    start_time = dateutil.parser.parse(request.form['start_time'])
+    duration = request.form.get('duration', DEFAULT_SHOW_DURATION, type=int)
+    if not 1 <= duration <= MAX_SHOW_DURATION:
+      raise ValueError(duration)
 
-    db.session.add(new_show)
+    scheduling.book_show(venue_id, artist_id, start_time, duration)
     db.session.commit()
+
+    cache.invalidate('shows')
+    cache.invalidate('venues')
+    cache.invalidate('venues_near')
+    cache.invalidate('show_venue', venue_id=venue_id)
+    cache.invalidate('show_artist', artist_id=artist_id)
+    cache.invalidate('venue_calendar', venue_id=venue_id)
+    cache.invalidate('artist_calendar', artist_id=artist_id)
     # on successful db insert, flash success
     flash('Show at' + request.form['venue_id']+ ' by' + request.form['artist_id']+ 'was successfully listed.')
+  except scheduling.ShowConflict as conflict:
+    db.session.rollback()
+    flash('Show could not be listed: ' + str(conflict) + '.')
   except ValueError:
     db.session.rollback()
     print(sys.exc_info())
@@ -501,13 +615,7 @@ if not app.debug:
 # Launch.
 #----------------------------------------------------------------------------#
 
-# Default port:
+# Development server; run server.py in production (see config.py for its
+# PORT, WEB_CONCURRENCY and other settings).
 if __name__ == '__main__':
     app.run()
-
-# Or specify port manually:
-'''
-if __name__ == '__main__':
-    port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
-'''
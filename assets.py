@@ -0,0 +1,215 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+
+import click
+from flask import current_app, request, send_from_directory, url_for
+from flask.cli import with_appcontext
+
+# Files concatenated into each bundle, in order, relative to the static
+# folder. Scripts that must run in <head> (modernizr, moment) are kept apart
+# from the deferred ones.
+BUNDLES = {
+  "main.css": [
+    'css/bootstrap.min.css',
+    'css/layout.main.css',
+    'css/main.css',
+    'css/main.responsive.css',
+    'css/main.quickfix.css',
+  ],
+  "head.js": [
+    'js/libs/modernizr-2.8.2.min.js',
+    'js/libs/moment.min.js',
+  ],
+  "main.js": [
+    'js/script.js',
+    'js/libs/bootstrap-3.1.1.min.js',
+    'js/plugins.js',
+  ],
+}
+
+# Single files templates link to with url_for('static', ...), fingerprinted
+# as they are
+FILES = [
+  'img/front-splash.jpg',
+  'js/libs/jquery-1.11.1.min.js',
+  'js/libs/respond-1.4.2.min.js',
+]
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+
+_CSS_COMMENT = re.compile(r'/\*(?!!).*?\*/', re.DOTALL)
+_CSS_SPACE = re.compile(r'\s+')
+_CSS_PUNCTUATION = re.compile(r'\s*([{};,])\s*')
+_CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def minify_css(css):
+  # Drops comments (keeping /*! licence comments), collapses whitespace and
+  # removes it around braces, semicolons and commas
+  css = _CSS_COMMENT.sub('', css)
+  css = _CSS_SPACE.sub(' ', css)
+  css = _CSS_PUNCTUATION.sub(r'\1', css)
+  return css.replace(';}', '}').strip()
+
+
+def minify_js(js):
+  # Needs the optional rjsmin package; scripts are bundled as they are
+  # without it (the libraries ship minified already)
+  try:
+    import rjsmin
+  except ImportError:
+    return js
+  return rjsmin.jsmin(js, keep_bang_comments=True)
+
+
+class Assets:
+  # Serves the bundles and fingerprinted files written by `flask assets
+  # build` from static/dist: their names carry a hash of their content, so
+  # they are sent with a year-long immutable Cache-Control, and as their
+  # prebuilt .br or .gz variant when the client accepts it. asset_urls() in
+  # templates gives the URLs of a bundle, falling back to its separate
+  # source files until a build exists; url_for('static', ...) of a
+  # fingerprinted file gives its dist copy.
+
+  def __init__(self, app=None):
+    self.manifest = {"bundles": {}, "files": {}}
+    self.version = ''
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    self.app = app
+    self.dist = os.path.join(app.static_folder, DIST)
+    self.max_age = app.config.get('ASSETS_MAX_AGE', 365 * 24 * 3600)
+    self.load()
+    app.extensions['assets'] = self
+    app.jinja_env.globals['asset_urls'] = self.urls
+    app.url_defaults(self._fingerprint)
+    app.add_url_rule(app.static_url_path + '/' + DIST + '/<path:filename>', 'dist', self.send)
+    app.cli.add_command(assets_command)
+
+  def load(self):
+    path = os.path.join(self.dist, MANIFEST)
+    if os.path.exists(path):
+      with open(path, 'rb') as f:
+        data = f.read()
+      self.manifest = json.loads(data)
+      self.version = hashlib.sha1(data).hexdigest()
+
+  def urls(self, bundle):
+    built = self.manifest['bundles'].get(bundle)
+    if built is not None:
+      return [url_for('dist', filename=built)]
+    return [url_for('static', filename=source) for source in BUNDLES[bundle]]
+
+  def _fingerprint(self, endpoint, values):
+    if endpoint == 'static':
+      built = self.manifest['files'].get(values.get('filename'))
+      if built is not None:
+        values['filename'] = posixpath.join(DIST, built)
+
+  def send(self, filename):
+    accepted = request.accept_encodings
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+      if accepted[encoding] and os.path.isfile(os.path.join(self.dist, filename + suffix)):
+        response = send_from_directory(self.dist, filename + suffix, max_age=self.max_age, download_name=filename,
+          mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.content_encoding = encoding
+        break
+    else:
+      response = send_from_directory(self.dist, filename, max_age=self.max_age)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.immutable = True
+    return response
+
+  def build(self):
+    # Writes the bundles and fingerprinted files with their compressed
+    # variants and the manifest. Earlier builds are left in place so pages
+    # cached before this one keep working.
+    os.makedirs(self.dist, exist_ok=True)
+    static = self.app.static_folder
+    manifest = {"bundles": {}, "files": {}}
+
+    for source in FILES:
+      with open(os.path.join(static, source), 'rb') as f:
+        manifest['files'][source] = self._write(posixpath.basename(source), f.read())
+
+    for bundle, sources in BUNDLES.items():
+      parts = []
+      for source in sources:
+        with open(os.path.join(static, source), encoding='utf-8') as f:
+          content = f.read()
+        if bundle.endswith('.css'):
+          parts.append(minify_css(self._rebase_urls(content, source, manifest)))
+        else:
+          # On its own line, so a trailing // comment can't swallow it
+          parts.append(minify_js(content).rstrip() + '\n;')
+      manifest['bundles'][bundle] = self._write(bundle, '\n'.join(parts).encode('utf-8'))
+
+    with open(os.path.join(self.dist, MANIFEST), 'w') as f:
+      json.dump(manifest, f, indent=2, sort_keys=True)
+    self.load()
+    return manifest
+
+  def _rebase_urls(self, css, source, manifest):
+    # Relative url()s point next to the source file; make them absolute, to
+    # a fingerprinted copy when the file exists
+    static = self.app.static_folder
+
+    def rebase(match):
+      target = match.group(2)
+      if target.startswith(('/', 'data:', 'http:', 'https:', '#')):
+        return match.group(0)
+      path, suffix = re.match(r'([^?#]*)(.*)', target).groups()
+      path = posixpath.normpath(posixpath.join(posixpath.dirname(source), path))
+      if os.path.isfile(os.path.join(static, path)):
+        if path not in manifest['files']:
+          with open(os.path.join(static, path), 'rb') as f:
+            manifest['files'][path] = self._write(posixpath.basename(path), f.read())
+        url = posixpath.join(self.app.static_url_path, DIST, manifest['files'][path])
+      else:
+        url = posixpath.join(self.app.static_url_path, path)
+      return 'url("%s%s")' % (url, suffix)
+
+    return _CSS_URL.sub(rebase, css)
+
+  def _write(self, name, content):
+    stem, extension = posixpath.splitext(name)
+    built = '%s.%s%s' % (stem, hashlib.sha256(content).hexdigest()[:12], extension)
+    path = os.path.join(self.dist, built)
+    with open(path, 'wb') as f:
+      f.write(content)
+    if extension in ('.css', '.js', '.svg', '.map', '.json', '.txt', '.ttf', '.otf', '.eot'):
+      variants = [('.gz', gzip.compress(content, 9, mtime=0))]
+      try:
+        import brotli
+      except ImportError:
+        pass
+      else:
+        variants.append(('.br', brotli.compress(content)))
+      for suffix, compressed in variants:
+        # A variant no smaller than the file isn't worth sending
+        if len(compressed) < len(content):
+          with open(path + suffix, 'wb') as f:
+            f.write(compressed)
+    return built
+
+
+@click.group('assets')
+def assets_command():
+  """Build the static asset bundles."""
+
+
+@assets_command.command('build')
+@with_appcontext
+def build_command():
+  """Bundle, minify, fingerprint and precompress the static assets."""
+  manifest = current_app.extensions['assets'].build()
+  for name, built in sorted(manifest['bundles'].items()) + sorted(manifest['files'].items()):
+    click.echo('%s -> %s/%s' % (name, DIST, built))
@@ -0,0 +1,52 @@
+"""Per-tile cost of the `datetime` Jinja filter.
+
+Compares the original filter, which re-parsed a strftime'd start_time and
+let Babel compile the pattern on every call, with format_datetime in
+app.py, which takes the datetime directly and reuses the compiled pattern.
+
+  python -m benchmarks.format_datetime --tiles 5000
+"""
+import argparse
+import random
+import timeit
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+from app import format_datetime
+
+
+def format_datetime_before(value, format='medium'):
+  date = dateutil.parser.parse(value)
+  if format == 'full':
+      format="EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+      format="EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(date, format, locale='en')
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--tiles', type=int, default=5000)
+  parser.add_argument('--repeat', type=int, default=5)
+  args = parser.parse_args()
+
+  rng = random.Random(0)
+  start = datetime(2026, 1, 1)
+  times = [start + timedelta(minutes=rng.randrange(525600)) for _ in range(args.tiles)]
+  strings = [value.strftime("%Y-%m-%d %H:%M:%S") for value in times]
+
+  for value, string in zip(times[:100], strings[:100]):
+    assert format_datetime(value, 'full') == format_datetime_before(string, 'full')
+
+  before = min(timeit.repeat(lambda: [format_datetime_before(value, 'full') for value in strings], number=1, repeat=args.repeat))
+  after = min(timeit.repeat(lambda: [format_datetime(value, 'full') for value in times], number=1, repeat=args.repeat))
+
+  print('before: %.2f us per tile' % (before / args.tiles * 1e6))
+  print('after:  %.2f us per tile' % (after / args.tiles * 1e6))
+  print('speedup: %.1fx' % (before / after))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,125 @@
+"""Query plans and timings for the show/venue lookup indexes.
+
+Seeds a synthetic catalog into DATABASE_URL, then runs the queries behind
+/venues, /venues/<id>, /artists/<id> and an area lookup first without and
+then with the show (venue_id, start_time) and (artist_id, start_time) and
+venue (city, state) indexes, printing the plan and the median latency of
+each. The tables' other indexes are present in both runs. The target
+database's tables are dropped and recreated.
+
+  python -m benchmarks.indexes --database-url postgresql://localhost/fyyur_bench
+"""
+import argparse
+import random
+import statistics
+import time
+
+from sqlalchemy import event
+
+from app import app, db
+from models import Venue, Show
+from queries import venue_areas, venue_detail, artist_detail
+from benchmarks.seed import seed
+
+# The lookup indexes measured here; the tables' other indexes stay in place
+# for both runs, so the difference is down to these alone
+MEASURED_INDEXES = ('ix_show_venue_id_start_time', 'ix_show_artist_id_start_time', 'ix_venue_city_state')
+
+
+def measured_indexes():
+  return [index for table in (Venue.__table__, Show.__table__) for index in table.indexes
+    if index.name in MEASURED_INDEXES]
+
+
+def scenarios(args, rng):
+  def area():
+    venue = Venue.query.get(rng.randint(1, args.venues))
+    return Venue.query.filter_by(city=venue.city, state=venue.state).all()
+
+  return [
+    ('venues', venue_areas),
+    ('venue detail', lambda: venue_detail(rng.randint(1, args.venues), past_limit=20, upcoming_limit=50)),
+    ('artist detail', lambda: artist_detail(rng.randint(1, args.artists), past_limit=20, upcoming_limit=50)),
+    ('venues in area', area),
+  ]
+
+
+def explain(run):
+  statements = []
+
+  def capture(conn, cursor, statement, parameters, context, executemany):
+    if statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+      statements.append((statement, parameters))
+
+  event.listen(db.engine, 'before_cursor_execute', capture)
+  try:
+    run()
+  finally:
+    event.remove(db.engine, 'before_cursor_execute', capture)
+
+  if db.engine.dialect.name == 'postgresql':
+    prefix = 'EXPLAIN ANALYZE '
+  else:
+    prefix = 'EXPLAIN QUERY PLAN '
+
+  plans = []
+  with db.engine.connect() as conn:
+    for statement, parameters in statements:
+      rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+      plans.append('\n'.join(' '.join(str(column) for column in row) for row in rows))
+  return plans
+
+
+def measure(label, args):
+  rng = random.Random(args.seed)
+  print('\n== %s ==' % label)
+  for name, run in scenarios(args, rng):
+    plans = explain(run)
+    timings = []
+    for _ in range(args.repeat):
+      started = time.perf_counter()
+      run()
+      timings.append((time.perf_counter() - started) * 1000)
+      db.session.rollback()
+    print('\n-- %s: median %.2f ms, max %.2f ms over %d runs' % (
+      name, statistics.median(timings), max(timings), args.repeat))
+    for plan in plans:
+      print(plan)
+
+
+def analyze():
+  db.session.execute(db.text('ANALYZE'))
+  db.session.commit()
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--database-url', default='sqlite:///fyyur_benchmark.db')
+  parser.add_argument('--venues', type=int, default=20000)
+  parser.add_argument('--artists', type=int, default=20000)
+  parser.add_argument('--shows', type=int, default=500000)
+  parser.add_argument('--repeat', type=int, default=20)
+  parser.add_argument('--seed', type=int, default=0)
+  args = parser.parse_args()
+
+  app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+  with app.app_context():
+    db.drop_all()
+    db.create_all()
+    for index in measured_indexes():
+      index.drop(bind=db.engine)
+
+    print('Seeding %d venues, %d artists and %d shows into %s' % (
+      args.venues, args.artists, args.shows, db.engine.url))
+    seed(venues=args.venues, artists=args.artists, shows=args.shows, random_seed=args.seed)
+    analyze()
+    measure('without indexes', args)
+
+    for index in measured_indexes():
+      index.create(bind=db.engine)
+    analyze()
+    measure('with indexes', args)
+
+
+if __name__ == '__main__':
+  main()
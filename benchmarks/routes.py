@@ -0,0 +1,284 @@
+"""Latency, throughput and query counts of every route.
+
+Seeds a synthetic catalog into DATABASE_URL and drives each route of app.py
+and the API through the Flask test client: the read routes first, including
+the metrics, exports and static files (assets are built first), then the
+form submissions and imports (create, edit, delete), which write to the
+seeded data. Requests accept gzip, as a browser's do. Prints p50/p95/p99
+latency, requests per second and the most queries a request issued for
+every route, taken from the query profiler's totals so streamed responses
+count too. The target database's tables are dropped and recreated.
+
+With --save-baseline the results are written to the baseline file; later
+runs against the same dataset compare with it and exit non-zero when a
+route issues more queries than before or its p95 grows by more than
+--tolerance. Timings only compare on the machine that recorded them.
+
+  python -m benchmarks.routes --venues 2000 --artists 2000 --shows 50000 --save-baseline
+  python -m benchmarks.routes --venues 2000 --artists 2000 --shows 50000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from app import app, db, cache, assets, profiler
+from cache import NullBackend
+from models import Venue, GENRES
+from benchmarks.seed import seed, STATES
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# p95 growth below this many milliseconds is treated as noise whatever the
+# tolerance, so sub-millisecond routes don't fail on jitter
+NOISE_FLOOR_MS = 2.0
+
+# Venues per request of the import route
+IMPORT_BATCH = 20
+
+HEADERS = {'Accept-Encoding': 'gzip'}
+
+
+def _entity_form(kind, i):
+  form = {
+    "name": 'Benchmark %s %d' % (kind, i),
+    "city": 'City %d' % (i % 200),
+    "state": STATES[i % len(STATES)],
+    "phone": '555-000-%04d' % (i % 10000),
+    "genres": GENRES[i % len(GENRES)],
+    "image_link": '',
+    "facebook_link": '',
+    "website_link": '',
+    "seeking_description": ''
+  }
+  if kind == 'Venue':
+    form['address'] = '%d Benchmark Ave' % i
+  return form
+
+
+def read_routes(args, rng):
+  # (name, method, request) where request(i) gives the path and form data of
+  # the i-th request
+  with app.test_request_context():
+    bundle = assets.urls('main.css')[0]
+  today = datetime.now().date()
+  month = today.strftime('%Y-%m')
+
+  def venue_id():
+    return rng.randint(1, args.venues)
+
+  def artist_id():
+    return rng.randint(1, args.artists)
+
+  def near():
+    return 'lat=%.4f&lon=%.4f&radius=%d' % (rng.uniform(25.0, 49.0), rng.uniform(-124.0, -67.0), 100)
+
+  def window():
+    start = today + timedelta(days=rng.randint(-365, 365))
+    return 'from=%s&to=%s' % (start, start + timedelta(days=30))
+
+  return [
+    ('GET /', 'GET', lambda i: ('/', None)),
+    ('GET /venues', 'GET', lambda i: ('/venues', None)),
+    ('GET /venues?genre', 'GET', lambda i: ('/venues?genre=%s' % rng.choice(GENRES), None)),
+    ('GET /venues/near', 'GET', lambda i: ('/venues/near?' + near(), None)),
+    ('GET /venues/search', 'GET', lambda i: ('/venues/search?search_term=venue+%d' % venue_id(), None)),
+    ('POST /venues/search', 'POST', lambda i: ('/venues/search', {"search_term": 'city %d' % rng.randrange(200)})),
+    ('GET /venues/<id>', 'GET', lambda i: ('/venues/%d' % venue_id(), None)),
+    ('GET /venues/<id>/calendar', 'GET', lambda i: ('/venues/%d/calendar?month=%s' % (venue_id(), month), None)),
+    ('GET /venues/<id>/edit', 'GET', lambda i: ('/venues/%d/edit' % venue_id(), None)),
+    ('GET /venues/create', 'GET', lambda i: ('/venues/create', None)),
+    ('GET /artists', 'GET', lambda i: ('/artists', None)),
+    ('GET /artists?genre', 'GET', lambda i: ('/artists?genre=%s' % rng.choice(GENRES), None)),
+    ('GET /artists/search', 'GET', lambda i: ('/artists/search?search_term=artist+%d' % artist_id(), None)),
+    ('POST /artists/search', 'POST', lambda i: ('/artists/search', {"search_term": 'city %d' % rng.randrange(200)})),
+    ('GET /artists/<id>', 'GET', lambda i: ('/artists/%d' % artist_id(), None)),
+    ('GET /artists/<id>/calendar', 'GET', lambda i: ('/artists/%d/calendar?month=%s' % (artist_id(), month), None)),
+    ('GET /artists/<id>/edit', 'GET', lambda i: ('/artists/%d/edit' % artist_id(), None)),
+    ('GET /artists/create', 'GET', lambda i: ('/artists/create', None)),
+    ('GET /shows', 'GET', lambda i: ('/shows', None)),
+    ('GET /shows?filters', 'GET', lambda i: ('/shows?%s&genre=%s' % (window(), rng.choice(GENRES)), None)),
+    ('GET /shows/create', 'GET', lambda i: ('/shows/create', None)),
+    ('GET /api/v1/venues', 'GET', lambda i: ('/api/v1/venues?genre=%s' % rng.choice(GENRES), None)),
+    ('GET /api/v1/artists', 'GET', lambda i: ('/api/v1/artists?genre=%s' % rng.choice(GENRES), None)),
+    ('GET /api/v1/shows', 'GET', lambda i: ('/api/v1/shows?' + window(), None)),
+    ('GET /api/v1/venues/near', 'GET', lambda i: ('/api/v1/venues/near?' + near(), None)),
+    ('GET /api/v1/venues/<id>', 'GET', lambda i: ('/api/v1/venues/%d' % venue_id(), None)),
+    ('GET /api/v1/artists/<id>', 'GET', lambda i: ('/api/v1/artists/%d' % artist_id(), None)),
+    ('GET /api/v1/venues/<id>/recommended-artists', 'GET',
+      lambda i: ('/api/v1/venues/%d/recommended-artists' % venue_id(), None)),
+    ('GET /api/v1/artists/<id>/recommended-venues', 'GET',
+      lambda i: ('/api/v1/artists/%d/recommended-venues' % artist_id(), None)),
+    ('GET /api/v1/export/venues', 'GET', lambda i: ('/api/v1/export/venues', None)),
+    ('GET /static/<file>', 'GET', lambda i: ('/static/css/main.css', None)),
+    ('GET /static/dist/<file>', 'GET', lambda i: (bundle, None)),
+    ('GET /metrics/cache', 'GET', lambda i: ('/metrics/cache', None)),
+    ('GET /metrics/pool', 'GET', lambda i: ('/metrics/pool', None)),
+    ('GET /metrics/queries', 'GET', lambda i: ('/metrics/queries', None)),
+  ]
+
+
+def write_routes(args, rng):
+  # Shows are booked on slots far beyond the seeded ones so none conflict.
+  # The delete step removes venues the create and import steps added.
+  future = datetime.now().replace(microsecond=0) + timedelta(days=3650)
+  created = []
+
+  def import_venues(i):
+    rows = []
+    for row in range(IMPORT_BATCH):
+      n = args.requests + IMPORT_BATCH * i + row
+      form = _entity_form('Venue', n)
+      form.update(genres=[form['genres']], facebook_link='https://www.facebook.com/venue%d' % n)
+      rows.append(json.dumps({key: value for key, value in form.items() if value}))
+    return '/api/v1/import/venues?format=ndjson', '\n'.join(rows).encode('utf-8')
+
+  def delete(i):
+    if not created:
+      created.extend(venue_id for venue_id, in db.session.query(Venue.id).filter(Venue.id > args.venues))
+      db.session.remove()
+    return '/venues/%d' % created[i], None
+
+  return [
+    ('POST /venues/create', 'POST', lambda i: ('/venues/create', _entity_form('Venue', i))),
+    ('POST /artists/create', 'POST', lambda i: ('/artists/create', _entity_form('Artist', i))),
+    ('POST /api/v1/import/venues', 'POST', import_venues),
+    ('POST /shows/create', 'POST', lambda i: ('/shows/create', {
+      "venue_id": str(rng.randint(1, args.venues)),
+      "artist_id": str(rng.randint(1, args.artists)),
+      "start_time": (future + timedelta(hours=3 * i)).isoformat(' '),
+      "duration": '120'
+    })),
+    ('POST /venues/<id>/edit', 'POST',
+      lambda i: ('/venues/%d/edit' % rng.randint(1, args.venues), _entity_form('Venue', i))),
+    ('POST /artists/<id>/edit', 'POST',
+      lambda i: ('/artists/%d/edit' % rng.randint(1, args.artists), _entity_form('Artist', i))),
+    ('DELETE /venues/<id>', 'DELETE', delete),
+  ]
+
+
+def percentile(timings, p):
+  return statistics.quantiles(timings, n=100, method='inclusive')[p - 1]
+
+
+def queries_so_far():
+  return sum(totals['queries'] for totals in profiler.stats().values())
+
+
+def run(client, method, make_request, requests, warmup):
+  timings = []
+  queries = 0
+  for i in range(warmup + requests):
+    path, data = make_request(i)
+    before = queries_so_far()
+    started = time.perf_counter()
+    # Buffered, so a streamed body is generated, and its queries recorded,
+    # within the timing
+    response = client.open(path, method=method, data=data, headers=HEADERS, buffered=True)
+    elapsed = time.perf_counter() - started
+    if response.status_code >= 400:
+      raise RuntimeError('%s %s returned %d' % (method, path, response.status_code))
+    if i >= warmup:
+      timings.append(elapsed * 1000)
+      queries = max(queries, queries_so_far() - before)
+  return {
+    "p50": round(percentile(timings, 50), 3),
+    "p95": round(percentile(timings, 95), 3),
+    "p99": round(percentile(timings, 99), 3),
+    "rps": round(len(timings) / (sum(timings) / 1000), 1),
+    "queries": queries
+  }
+
+
+def compare(results, baseline, tolerance):
+  # Regressions of `results` against a baseline, as printable lines
+  regressions = []
+  for name, result in results.items():
+    before = baseline.get(name)
+    if before is None:
+      continue
+    if result['queries'] > before['queries']:
+      regressions.append('%s: %d queries, was %d' % (name, result['queries'], before['queries']))
+    if result['p95'] > before['p95'] * (1 + tolerance) and result['p95'] - before['p95'] > NOISE_FLOOR_MS:
+      regressions.append('%s: p95 %.2f ms, was %.2f ms' % (name, result['p95'], before['p95']))
+  return regressions
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--database-url', default='sqlite:///fyyur_benchmark.db')
+  parser.add_argument('--venues', type=int, default=2000)
+  parser.add_argument('--artists', type=int, default=2000)
+  parser.add_argument('--shows', type=int, default=50000)
+  parser.add_argument('--requests', type=int, default=100, help='Timed requests per route.')
+  parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per route before timing.')
+  parser.add_argument('--cache', choices=('none', 'lru'), default='none',
+    help='Response cache during the run; with none every request renders its page.')
+  parser.add_argument('--baseline', default=BASELINE_FILE)
+  parser.add_argument('--save-baseline', action='store_true', help='Record this run as the baseline.')
+  parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p95 growth over the baseline.')
+  parser.add_argument('--seed', type=int, default=0)
+  args = parser.parse_args()
+
+  app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+  app.config['WTF_CSRF_ENABLED'] = False
+  if args.cache == 'none':
+    cache.backend = NullBackend()
+  dataset = {
+    "database": args.database_url.split(':', 1)[0],
+    "venues": args.venues,
+    "artists": args.artists,
+    "shows": args.shows,
+    "cache": args.cache,
+    "seed": args.seed
+  }
+
+  baseline = None
+  if not args.save_baseline and os.path.exists(args.baseline):
+    with open(args.baseline) as f:
+      baseline = json.load(f)
+    if baseline['dataset'] != dataset:
+      parser.error('%s was recorded with %s; run with the same options or --save-baseline' % (
+        args.baseline, baseline['dataset']))
+
+  with app.app_context():
+    db.drop_all()
+    db.create_all()
+    print('Seeding %d venues, %d artists and %d shows into %s' % (
+      args.venues, args.artists, args.shows, db.engine.url))
+    seed(venues=args.venues, artists=args.artists, shows=args.shows, random_seed=args.seed)
+    db.session.remove()
+  assets.build()
+
+  rng = random.Random(args.seed)
+  client = app.test_client(use_cookies=False)
+  results = {}
+  print('\n%-46s %9s %9s %9s %9s %8s' % ('route', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s', 'queries'))
+  for name, method, make_request in read_routes(args, rng) + write_routes(args, rng):
+    warmup = 0 if method != 'GET' else args.warmup
+    result = results[name] = run(client, method, make_request, args.requests, warmup)
+    print('%-46s %9.2f %9.2f %9.2f %9.1f %8d' % (
+      name, result['p50'], result['p95'], result['p99'], result['rps'], result['queries']))
+
+  if args.save_baseline:
+    with open(args.baseline, 'w') as f:
+      json.dump({"dataset": dataset, "recorded_at": datetime.now().isoformat(), "routes": results}, f, indent=2)
+    print('\nSaved baseline to %s' % args.baseline)
+  elif baseline is None:
+    print('\nNo baseline at %s; run with --save-baseline to record one' % args.baseline)
+  else:
+    regressions = compare(results, baseline['routes'], args.tolerance)
+    if regressions:
+      print('\nRegressions against %s:' % args.baseline)
+      for line in regressions:
+        print('  ' + line)
+      sys.exit(1)
+    print('\nNo regressions against %s' % args.baseline)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,89 @@
+import random
+from datetime import datetime, timedelta
+
+from app import db
+import counters
+from forms import VenueForm
+from models import Venue, Artist, Show, search_document, show_end_time, DEFAULT_SHOW_DURATION
+
+GENRES = [value for value, _ in VenueForm.genres.kwargs['choices']]
+STATES = [value for value, _ in VenueForm.state.kwargs['choices']]
+
+
+def _insert(model, rows, chunk_size):
+  chunk = []
+  for row in rows:
+    chunk.append(row)
+    if len(chunk) == chunk_size:
+      db.session.execute(model.__table__.insert(), chunk)
+      chunk = []
+  if chunk:
+    db.session.execute(model.__table__.insert(), chunk)
+
+
+def _shows(rng, now, venues, artists, shows):
+  # Shows start on three-hourly slots and last two hours; a venue or artist
+  # is never given the same slot twice, so nothing overlaps.
+  taken = set()
+  for i in range(1, shows + 1):
+    while True:
+      venue_id = rng.randint(1, venues)
+      artist_id = rng.randint(1, artists)
+      slot = rng.randint(-8 * 730, 8 * 365)
+      if ('venue', venue_id, slot) not in taken and ('artist', artist_id, slot) not in taken:
+        break
+    taken.add(('venue', venue_id, slot))
+    taken.add(('artist', artist_id, slot))
+    start_time = now + timedelta(hours=3 * slot)
+    yield {
+      "id": i,
+      "venue_id": venue_id,
+      "artist_id": artist_id,
+      "start_time": start_time,
+      "duration": DEFAULT_SHOW_DURATION,
+      "end_time": show_end_time(start_time, DEFAULT_SHOW_DURATION)
+    }
+
+
+def seed(venues=1000, artists=1000, shows=50000, cities=200, chunk_size=5000, random_seed=0):
+  # Fills freshly created (empty) tables with a synthetic catalog. Ids are
+  # assigned explicitly so shows can reference venues and artists without
+  # reading them back.
+  rng = random.Random(random_seed)
+  now = datetime.now().replace(microsecond=0)
+  areas = [('City %d' % i, rng.choice(STATES)) for i in range(cities)]
+
+  def entity(i, kind):
+    city, state = rng.choice(areas)
+    name = '%s %d' % (kind, i)
+    genres = rng.sample(GENRES, rng.randint(1, 3))
+    return {
+      "id": i,
+      "name": name,
+      "city": city,
+      "state": state,
+      "phone": '555-%03d-%04d' % (rng.randrange(1000), rng.randrange(10000)),
+      "genres": genres,
+      "image_link": 'https://example.com/%s/%d.jpg' % (kind.lower(), i),
+      "latitude": rng.uniform(25.0, 49.0),
+      "longitude": rng.uniform(-124.0, -67.0),
+      "search_document": search_document(name, city, state, genres)
+    }
+
+  _insert(Venue, (dict(entity(i, 'Venue'), address='%d Main St' % i, seeking_talent=rng.random() < 0.3)
+    for i in range(1, venues + 1)), chunk_size)
+  _insert(Artist, (dict(entity(i, 'Artist'), seeking_venue=rng.random() < 0.3)
+    for i in range(1, artists + 1)), chunk_size)
+  _insert(Show, _shows(rng, now, venues, artists, shows), chunk_size)
+
+  db.session.commit()
+
+  if db.engine.dialect.name == 'postgresql':
+    for model in (Venue, Artist, Show):
+      table = model.__tablename__
+      db.session.execute(db.text(
+        "SELECT setval(pg_get_serial_sequence('\"%s\"', 'id'), (SELECT max(id) FROM \"%s\"))" % (table, table)
+      ))
+    db.session.commit()
+
+  counters.rebuild()
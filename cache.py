@@ -0,0 +1,209 @@
+import functools
+import threading
+import time
+from collections import OrderedDict, Counter
+
+from flask import g, request
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+from conditional import has_flashes
+
+
+class NullBackend:
+  # Stores nothing; used when caching is switched off.
+
+  def get_many(self, keys):
+    return [None] * len(keys)
+
+  def set(self, key, value, ttl):
+    pass
+
+  def incr(self, key):
+    return 0
+
+
+class LRUBackend:
+  # In-process cache evicting the least recently used entry beyond
+  # max_entries. Version counters live apart from the entries so eviction
+  # can never roll a version back and revive stale pages.
+
+  def __init__(self, max_entries=1024):
+    self.max_entries = max_entries
+    self.entries = OrderedDict()
+    self.versions = {}
+    self.lock = threading.Lock()
+
+  def get_many(self, keys):
+    now = time.monotonic()
+    values = []
+    with self.lock:
+      for key in keys:
+        if key in self.versions:
+          values.append(self.versions[key])
+          continue
+        entry = self.entries.get(key)
+        if entry is None or entry[1] < now:
+          self.entries.pop(key, None)
+          values.append(None)
+          continue
+        self.entries.move_to_end(key)
+        values.append(entry[0])
+    return values
+
+  def set(self, key, value, ttl):
+    with self.lock:
+      self.entries[key] = (value, time.monotonic() + ttl)
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.max_entries:
+        self.entries.popitem(last=False)
+
+  def incr(self, key):
+    with self.lock:
+      self.versions[key] = self.versions.get(key, 0) + 1
+      return self.versions[key]
+
+
+class RedisBackend:
+  # Shared cache on a Redis-compatible server. `client` only needs the
+  # mget/set/incr subset of the redis-py API, so a fake can stand in.
+
+  def __init__(self, client, prefix='fyyur:'):
+    self.client = client
+    self.prefix = prefix
+
+  def get_many(self, keys):
+    values = self.client.mget([self.prefix + key for key in keys])
+    return [value.decode('utf-8') if isinstance(value, bytes) else value for value in values]
+
+  def set(self, key, value, ttl):
+    self.client.set(self.prefix + key, value, ex=ttl)
+
+  def incr(self, key):
+    return self.client.incr(self.prefix + key)
+
+
+class ResponseCache:
+  # Caches the HTML returned by GET views under their endpoint, view
+  # arguments and query string. Entry keys embed two version numbers, one
+  # for the endpoint and one for the particular view arguments, so writes
+  # invalidate either a single page or a whole endpoint by bumping a
+  # version instead of hunting for keys. Under @conditional they also embed
+  # the page's ETag, which follows the database, so writes the versions
+  # never hear of (other processes, CLI commands) still miss.
+
+  def __init__(self, app=None, backend=None):
+    self.backend = backend
+    self.ttl = 300
+    self.hits = Counter()
+    self.misses = Counter()
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    self.ttl = app.config.get('CACHE_TTL', 300)
+    if self.backend is None:
+      kind = app.config.get('CACHE_BACKEND', 'lru')
+      if kind == 'redis':
+        import redis
+        self.backend = RedisBackend(redis.Redis.from_url(app.config['CACHE_REDIS_URL']))
+      elif kind == 'lru':
+        self.backend = LRUBackend(app.config.get('CACHE_MAX_ENTRIES', 1024))
+      else:
+        self.backend = NullBackend()
+    app.extensions['response_cache'] = self
+
+    app.jinja_env.add_extension(FragmentCache)
+    app.jinja_env.fragment_cache = LRUBackend(app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', 4096))
+    app.jinja_env.fragment_cache_ttl = app.config.get('FRAGMENT_CACHE_TTL', 3600)
+
+  @staticmethod
+  def _scope(endpoint, view_args):
+    return '%s(%s)' % (endpoint, ','.join('%s=%s' % item for item in sorted(view_args.items())))
+
+  def _lookup(self, view_args):
+    # (key, cached body or None) for the current request, or None when it
+    # bypasses the cache. Pages carrying flashed messages are per-visitor.
+    if request.method != 'GET' or has_flashes():
+      return None
+
+    endpoint = request.endpoint
+    scope = self._scope(endpoint, view_args)
+    endpoint_version, scope_version = self.backend.get_many(['v:' + endpoint, 'v:' + scope])
+    key = 'page:%s:%s:%s:%s?%s' % (scope, endpoint_version or 0, scope_version or 0, g.get('etag', ''),
+      '&'.join('%s=%s' % item for item in sorted(request.args.items(multi=True))))
+
+    body, = self.backend.get_many([key])
+    if body is not None:
+      self.hits[endpoint] += 1
+    else:
+      self.misses[endpoint] += 1
+    return key, body
+
+  def _store(self, key, body):
+    if isinstance(body, str):
+      self.backend.set(key, body, self.ttl)
+
+  def cached(self, view):
+    @functools.wraps(view)
+    def wrapper(**view_args):
+      lookup = self._lookup(view_args)
+      if lookup is None:
+        return view(**view_args)
+      key, body = lookup
+      if body is None:
+        body = view(**view_args)
+        self._store(key, body)
+      return body
+    return wrapper
+
+  def invalidate(self, endpoint, **view_args):
+    # Drops the cached page of `endpoint` for these view arguments, or every
+    # page of the endpoint when no arguments are given.
+    if view_args:
+      self.backend.incr('v:' + self._scope(endpoint, view_args))
+    else:
+      self.backend.incr('v:' + endpoint)
+
+  def stats(self):
+    return {
+      endpoint: {
+        "hits": self.hits[endpoint],
+        "misses": self.misses[endpoint]
+      }
+      for endpoint in set(self.hits) | set(self.misses)
+    }
+
+
+class FragmentCache(Extension):
+  # {% cache 'show-tile', show.id, show.version %}...{% endcache %}
+  #
+  # Renders the enclosed block once per distinct key and reuses its markup
+  # from an in-process LRU while the key stays the same. Nothing
+  # invalidates fragments, so the key has to carry the version of
+  # everything the block shows (updated_at columns); superseded entries
+  # just age out. Being keyed by versions, fragments are safe to keep per
+  # process whatever CACHE_BACKEND the pages use.
+
+  tags = {'cache'}
+
+  def __init__(self, environment):
+    super().__init__(environment)
+    environment.extend(fragment_cache=NullBackend(), fragment_cache_ttl=3600)
+
+  def parse(self, parser):
+    lineno = next(parser.stream).lineno
+    key = [parser.parse_expression()]
+    while parser.stream.skip_if('comma'):
+      key.append(parser.parse_expression())
+    body = parser.parse_statements(['name:endcache'], drop_needle=True)
+    call = self.call_method('_render', [nodes.Const(parser.name), nodes.List(key)])
+    return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+  def _render(self, template, key, caller):
+    name = 'fragment:%s:%r' % (template, key)
+    body, = self.environment.fragment_cache.get_many([name])
+    if body is None:
+      body = caller()
+      self.environment.fragment_cache.set(name, body, self.environment.fragment_cache_ttl)
+    return body
@@ -0,0 +1,73 @@
+import functools
+import hashlib
+
+from flask import current_app, g, make_response, request, session, Response
+from werkzeug.http import is_resource_modified
+
+
+def has_flashes():
+  # Whether the page will show flashed messages. Visitors without a session
+  # cookie have none, and not opening their session keeps Flask from adding
+  # Vary: Cookie to responses that don't depend on it.
+  if current_app.session_cookie_name not in request.cookies:
+    return False
+  return bool(session.get('_flashes'))
+
+
+def _templates_digest(app):
+  # Part of every ETag, so deploying changed templates invalidates them
+  digest = app.extensions.get('templates_digest')
+  if digest is None:
+    sha = hashlib.sha1()
+    for name in sorted(app.jinja_env.list_templates()):
+      source, _, _ = app.jinja_loader.get_source(app.jinja_env, name)
+      sha.update(name.encode('utf-8'))
+      sha.update(source.encode('utf-8'))
+    # Pages link to fingerprinted assets, which change with each build
+    sha.update(getattr(app.extensions.get('assets'), 'version', '').encode('utf-8'))
+    digest = app.extensions['templates_digest'] = sha.hexdigest()
+  return digest
+
+
+def _etag(parts):
+  return hashlib.sha1(repr(
+    (_templates_digest(current_app), request.full_path) + tuple(parts)
+  ).encode('utf-8')).hexdigest()
+
+
+def _finish(response, etag, last_modified):
+  response.set_etag(etag)
+  if last_modified is not None:
+    response.last_modified = last_modified
+  response.cache_control.no_cache = True
+  return response
+
+
+def conditional(version):
+  # Adds ETag and Last-Modified headers to a GET view and answers matching
+  # If-None-Match / If-Modified-Since requests with 304 before the view
+  # runs. `version` takes the view's arguments and returns a tuple of the
+  # values the page depends on, ending with its last modification time (None
+  # when that can't be told, e.g. after a delete), or None to skip
+  # conditional handling (e.g. for a missing entity). The ETag is left in
+  # g.etag, where ResponseCache makes it part of the page's key, so a body
+  # cached for an older version is never sent under a newer ETag.
+  def decorator(view):
+    @functools.wraps(view)
+    def wrapper(**view_args):
+      if request.method != 'GET' or has_flashes():
+        return view(**view_args)
+
+      parts = version(**view_args)
+      if parts is None:
+        return view(**view_args)
+
+      etag, last_modified = _etag(parts), parts[-1]
+      g.etag = etag
+      if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = make_response(view(**view_args))
+      else:
+        response = Response(status=304)
+      return _finish(response, etag, last_modified)
+    return wrapper
+  return decorator
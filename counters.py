@@ -0,0 +1,181 @@
+import time
+from datetime import datetime, timedelta
+
+import click
+
+from app import app, db, cache
+from models import Venue, Artist, Show, CounterWatermark
+
+# Venue.upcoming_shows_count / past_shows_count and their Artist
+# counterparts count shows relative to the watermark's rolled_at rather
+# than the current time: a show is upcoming while it starts after the
+# watermark. Rolling advances the watermark and moves the shows it passes
+# over from the upcoming to the past counters; requests roll once the
+# watermark is COUNTER_ROLL_INTERVAL seconds old, and `flask counters roll`
+# does it on demand.
+
+_COUNTED = ((Venue, Show.venue_id), (Artist, Show.artist_id))
+
+
+def _watermark(for_update=False):
+  # Writers share-lock the watermark row so a roll cannot move it between
+  # their reading it and committing their counter updates.
+  watermark = CounterWatermark.query.filter_by(id=1).with_for_update(read=not for_update).first()
+  if watermark is None:
+    watermark = CounterWatermark(id=1, rolled_at=datetime.now())
+    db.session.add(watermark)
+    db.session.flush()
+  return watermark
+
+
+def _increment(model, entity_id, column, amount):
+  counter = getattr(model, column)
+  model.query.filter_by(id=entity_id).update({counter: counter + amount}, synchronize_session=False)
+
+
+def record_show(venue_id, artist_id, start_time):
+  # Counts a newly added show for its venue and artist. Runs in the caller's
+  # transaction; the caller commits.
+  if start_time > _watermark().rolled_at:
+    column = 'upcoming_shows_count'
+  else:
+    column = 'past_shows_count'
+  _increment(Venue, venue_id, column, 1)
+  _increment(Artist, artist_id, column, 1)
+
+
+def record_shows(shows):
+  # Counts a batch of newly added (venue_id, artist_id, start_time) shows with
+  # one executemany UPDATE per counter. Runs in the caller's transaction.
+  rolled_at = _watermark().rolled_at
+  deltas = {}
+  for venue_id, artist_id, start_time in shows:
+    column = 'upcoming_shows_count' if start_time > rolled_at else 'past_shows_count'
+    for model, entity_id in ((Venue, venue_id), (Artist, artist_id)):
+      key = (model, column)
+      deltas.setdefault(key, {})
+      deltas[key][entity_id] = deltas[key].get(entity_id, 0) + 1
+  for (model, column), amounts in deltas.items():
+    counter = getattr(model.__table__.c, column)
+    db.session.execute(
+      model.__table__.update().where(
+        model.__table__.c.id == db.bindparam('entity_id')
+      ).values({counter: counter + db.bindparam('amount')}),
+      [{"entity_id": entity_id, "amount": amount} for entity_id, amount in amounts.items()]
+    )
+
+
+def remove_venue_shows(venue_id):
+  # Deletes a venue's shows and takes them off their artists' counters.
+  # Runs in the caller's transaction; the caller commits.
+  upcoming = Show.start_time > _watermark().rolled_at
+  rows = db.session.query(
+    Show.artist_id, upcoming, db.func.count(Show.id)
+  ).filter(
+    Show.venue_id == venue_id
+  ).group_by(
+    Show.artist_id, upcoming
+  ).all()
+  for artist_id, is_upcoming, count in rows:
+    _increment(Artist, artist_id, 'upcoming_shows_count' if is_upcoming else 'past_shows_count', -count)
+  Show.query.filter_by(venue_id=venue_id).delete(synchronize_session=False)
+
+
+def roll(now=None):
+  # Moves the shows that started since the last roll from the upcoming to the
+  # past counters. Returns the number of shows moved.
+  now = now or datetime.now()
+  watermark = _watermark(for_update=True)
+  if now <= watermark.rolled_at:
+    db.session.rollback()
+    return 0
+
+  started = db.and_(Show.start_time > watermark.rolled_at, Show.start_time <= now)
+  moved = Show.query.filter(started).count()
+  if moved:
+    for model, show_fk in _COUNTED:
+      count = db.select(db.func.count(Show.id)).where(show_fk == model.id, started).scalar_subquery()
+      model.query.filter(
+        model.id.in_(db.select(show_fk).where(started))
+      ).update({
+        model.upcoming_shows_count: model.upcoming_shows_count - count,
+        model.past_shows_count: model.past_shows_count + count
+      }, synchronize_session=False)
+
+  watermark.rolled_at = now
+  db.session.commit()
+
+  if moved:
+    for endpoint in ('venues', 'venues_near', 'show_venue', 'show_artist'):
+      cache.invalidate(endpoint)
+  return moved
+
+
+_checked_at = None
+
+
+def roll_if_stale(now=None):
+  # Rolls when the watermark is more than COUNTER_ROLL_INTERVAL seconds old,
+  # looking at it at most once per interval in each process.
+  global _checked_at
+  interval = timedelta(seconds=app.config.get('COUNTER_ROLL_INTERVAL', 60))
+  now = now or datetime.now()
+  if not interval or (_checked_at is not None and now - _checked_at < interval):
+    return
+  _checked_at = now
+  rolled_at = db.session.query(CounterWatermark.rolled_at).scalar()
+  if rolled_at is None or now - rolled_at < interval:
+    return
+  # Read requests would otherwise send the roll's updates to the replica
+  session = db.session()
+  session.use_primary = True
+  try:
+    roll(now)
+  finally:
+    session.use_primary = False
+
+
+# Ahead of the query profiler, which would otherwise charge the roll to
+# whichever request happened to trigger it
+app.before_request_funcs.setdefault(None, []).insert(0, roll_if_stale)
+
+
+def rebuild(now=None):
+  # Recomputes every counter from the show table.
+  now = now or datetime.now()
+  watermark = _watermark(for_update=True)
+  for model, show_fk in _COUNTED:
+    upcoming = db.select(db.func.count(Show.id)).where(show_fk == model.id, Show.start_time > now).scalar_subquery()
+    past = db.select(db.func.count(Show.id)).where(show_fk == model.id, Show.start_time <= now).scalar_subquery()
+    model.query.update({
+      model.upcoming_shows_count: upcoming,
+      model.past_shows_count: past
+    }, synchronize_session=False)
+  watermark.rolled_at = now
+  db.session.commit()
+
+  for endpoint in ('venues', 'venues_near', 'show_venue', 'show_artist'):
+    cache.invalidate(endpoint)
+
+
+@app.cli.group()
+def counters():
+  """Maintain the venue and artist show counters."""
+
+
+@counters.command('roll')
+@click.option('--every', type=int, default=0, help='Keep rolling every N seconds.')
+def roll_command(every):
+  """Move started shows from the upcoming to the past counters."""
+  while True:
+    click.echo('Moved %d shows to past counters' % roll())
+    if not every:
+      break
+    time.sleep(every)
+
+
+@counters.command('rebuild')
+def rebuild_command():
+  """Recompute all counters from the show table."""
+  rebuild()
+  click.echo('Rebuilt show counters')
@@ -0,0 +1,111 @@
+import logging
+import threading
+import time
+
+from flask import has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import exc, orm
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class InstrumentedQueuePool(QueuePool):
+  # QueuePool that counts checkouts and measures the checkouts that had to
+  # wait because every pooled and overflow connection was in use.
+
+  log_interval = 60
+
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.stats_lock = threading.Lock()
+    self.checkouts = 0
+    self.waits = 0
+    self.timeouts = 0
+    self.wait_seconds = 0.0
+    self.max_wait_seconds = 0.0
+    self.max_overflow_seen = 0
+    self.last_logged = 0.0
+
+  def _do_get(self):
+    exhausted = self.checkedout() >= self.size() + self._max_overflow
+    started = time.perf_counter()
+    try:
+      return super()._do_get()
+    except exc.TimeoutError:
+      with self.stats_lock:
+        self.timeouts += 1
+      raise
+    finally:
+      waited = time.perf_counter() - started
+      with self.stats_lock:
+        self.checkouts += 1
+        self.max_overflow_seen = max(self.max_overflow_seen, self.overflow())
+        if exhausted:
+          self.waits += 1
+          self.wait_seconds += waited
+          self.max_wait_seconds = max(self.max_wait_seconds, waited)
+          if time.monotonic() - self.last_logged >= self.log_interval:
+            self.last_logged = time.monotonic()
+            logger.warning('Connection pool exhausted: %s', self.stats())
+
+  def stats(self):
+    return {
+      "size": self.size(),
+      "checked_in": self.checkedin(),
+      "checked_out": self.checkedout(),
+      "overflow": self.overflow(),
+      "max_overflow_seen": self.max_overflow_seen,
+      "checkouts": self.checkouts,
+      "waits": self.waits,
+      "timeouts": self.timeouts,
+      "wait_ms_total": round(self.wait_seconds * 1000, 3),
+      "wait_ms_max": round(self.max_wait_seconds * 1000, 3)
+    }
+
+
+class RoutingSession(SignallingSession):
+  # Sends statements issued while serving a read-only request to the
+  # 'replica' bind when one is configured; everything else, including any
+  # flush, goes to the primary, as does everything while use_primary is
+  # set.
+
+  use_primary = False
+
+  def __init__(self, db, **options):
+    self.db = db
+    SignallingSession.__init__(self, db, **options)
+
+  def get_bind(self, mapper=None, clause=None, **kwargs):
+    if (not self._flushing and not self.use_primary and has_request_context() and request.method in READ_METHODS
+        and 'replica' in (self.app.config.get('SQLALCHEMY_BINDS') or {})):
+      return self.db.get_engine(self.app, bind='replica')
+    return SignallingSession.get_bind(self, mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+  def create_session(self, options):
+    return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+  def apply_driver_hacks(self, app, sa_url, options):
+    # SQLite keeps the pools Flask-SQLAlchemy picks for it; every other
+    # database gets an instrumented QueuePool sized by SQLALCHEMY_POOL_OPTIONS.
+    sa_url, options = super().apply_driver_hacks(app, sa_url, options)
+    if not sa_url.drivername.startswith('sqlite'):
+      options['poolclass'] = InstrumentedQueuePool
+      options.update(app.config.get('SQLALCHEMY_POOL_OPTIONS') or {})
+    return sa_url, options
+
+  def pool_status(self, app=None):
+    app = self.get_app(app)
+    status = {}
+    for bind in [None] + list(app.config.get('SQLALCHEMY_BINDS') or ()):
+      pool = self.get_engine(app, bind).pool
+      if isinstance(pool, InstrumentedQueuePool):
+        status[bind or 'primary'] = pool.stats()
+      else:
+        status[bind or 'primary'] = {"pool": pool.status()}
+    return status
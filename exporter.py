@@ -0,0 +1,147 @@
+import csv
+import io
+import json
+import sys
+import zlib
+from datetime import datetime
+
+import click
+
+from app import app
+from queries import CATALOG_COLUMNS, catalog_query
+
+# Rows fetched per round trip from the server-side cursor; also the CSV
+# chunk and Parquet row group size, so memory stays flat whatever the size
+# of the table
+EXPORT_BATCH_SIZE = 5000
+
+FORMATS = {
+  'csv': ('application/gzip', 'csv.gz'),
+  'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+def _batches(kind, batch_size):
+  rows = catalog_query(kind).execution_options(stream_results=True).yield_per(batch_size)
+  batch = []
+  for row in rows:
+    batch.append(row)
+    if len(batch) == batch_size:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+
+def _csv_value(value):
+  # genres are written as a JSON array and times in the forms' format, so
+  # they survive the round trip, including through `flask import`
+  if isinstance(value, list):
+    return json.dumps(value)
+  if isinstance(value, datetime):
+    return value.isoformat(sep=' ', timespec='seconds')
+  return value
+
+
+def export_csv(kind, batch_size=EXPORT_BATCH_SIZE):
+  # Yields a gzip-compressed CSV export chunk by chunk.
+  compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+  text = io.StringIO()
+  writer = csv.writer(text)
+  writer.writerow([column.key for column in CATALOG_COLUMNS[kind]])
+  for batch in _batches(kind, batch_size):
+    writer.writerows([_csv_value(value) for value in row] for row in batch)
+    chunk = compressor.compress(text.getvalue().encode('utf-8'))
+    text.seek(0)
+    text.truncate()
+    if chunk:
+      yield chunk
+  yield compressor.compress(text.getvalue().encode('utf-8')) + compressor.flush()
+
+
+class _Drain(io.RawIOBase):
+  # Write-only file that hands back whatever was written since the last
+  # drain(), so a Parquet file can be streamed as it is produced.
+
+  def __init__(self):
+    self.chunks = []
+    self.position = 0
+
+  def writable(self):
+    return True
+
+  def write(self, data):
+    self.chunks.append(bytes(data))
+    self.position += len(data)
+    return len(data)
+
+  def tell(self):
+    return self.position
+
+  def drain(self):
+    data = b''.join(self.chunks)
+    self.chunks = []
+    return data
+
+
+def export_parquet(kind, batch_size=EXPORT_BATCH_SIZE):
+  # Returns an iterator over a Parquet export, one row group per batch.
+  # Needs pyarrow; raises ImportError up front when it is missing.
+  import pyarrow
+  import pyarrow.parquet
+
+  arrow_types = {
+    int: pyarrow.int64(),
+    float: pyarrow.float64(),
+    str: pyarrow.string(),
+    bool: pyarrow.bool_(),
+    list: pyarrow.list_(pyarrow.string()),
+  }
+  columns = CATALOG_COLUMNS[kind]
+  fields = []
+  for column in columns:
+    python_type = getattr(column.type, 'impl', column.type).python_type
+    fields.append(pyarrow.field(column.key, arrow_types.get(python_type, pyarrow.timestamp('us'))))
+  schema = pyarrow.schema(fields)
+  return _parquet_chunks(kind, batch_size, pyarrow, schema)
+
+
+def _parquet_chunks(kind, batch_size, pyarrow, schema):
+  sink = _Drain()
+  writer = pyarrow.parquet.ParquetWriter(sink, schema, compression='snappy')
+  for batch in _batches(kind, batch_size):
+    writer.write_table(pyarrow.Table.from_pylist([row._asdict() for row in batch], schema=schema))
+    chunk = sink.drain()
+    if chunk:
+      yield chunk
+  writer.close()
+  yield sink.drain()
+
+
+def export_rows(kind, fmt='csv', batch_size=EXPORT_BATCH_SIZE):
+  if fmt == 'parquet':
+    return export_parquet(kind, batch_size)
+  return export_csv(kind, batch_size)
+
+
+@app.cli.command('export')
+@click.argument('kind', type=click.Choice(sorted(CATALOG_COLUMNS)))
+@click.argument('output', required=False)
+@click.option('--format', 'fmt', type=click.Choice(sorted(FORMATS)), default='csv', show_default=True)
+@click.option('--batch-size', type=int, default=EXPORT_BATCH_SIZE, show_default=True)
+def export_command(kind, output, fmt, batch_size):
+  """Export venues, artists or the show listing as gzipped CSV or Parquet.
+
+  Writes to OUTPUT, by default <kind>.csv.gz or <kind>.parquet; '-' writes
+  to stdout.
+  """
+  output = output or '%s.%s' % (kind, FORMATS[fmt][1])
+  stream = sys.stdout.buffer if output == '-' else open(output, 'wb')
+  try:
+    for chunk in export_rows(kind, fmt, batch_size):
+      stream.write(chunk)
+  finally:
+    if stream is not sys.stdout.buffer:
+      stream.close()
+  if output != '-':
+    click.echo('Exported %s to %s' % (kind, output))
@@ -1,7 +1,7 @@
 from datetime import datetime
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, IntegerField
+from wtforms.validators import DataRequired, AnyOf, URL, NumberRange, Optional
 
 class ShowForm(Form):
     artist_id = StringField(
@@ -15,6 +15,12 @@ class ShowForm(Form):
         validators=[DataRequired()],
         default= datetime.today()
     )
+    # minutes; bounds match models.MAX_SHOW_DURATION
+    duration = IntegerField(
+        'duration',
+        validators=[Optional(), NumberRange(min=1, max=12 * 60)],
+        default=120
+    )
 
 class VenueForm(Form):
     name = StringField(
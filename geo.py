@@ -0,0 +1,57 @@
+import csv
+import math
+import os
+
+# Offline stand-in for a geocoder: coordinates of common US cities and, for
+# everything else, the centre of the state. Kept free of app imports so
+# migrations can use it too.
+CITIES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'cities.csv')
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+_places = None
+
+
+def _load_places():
+  global _places
+  if _places is None:
+    places = {}
+    with open(CITIES_FILE, newline='', encoding='utf-8') as f:
+      for row in csv.DictReader(f):
+        key = (row['city'].strip().lower(), row['state'].strip().upper())
+        places[key] = (float(row['latitude']), float(row['longitude']))
+    _places = places
+  return _places
+
+
+def geocode(city, state):
+  # (latitude, longitude) of a city, falling back to its state's centre,
+  # or None when neither is known.
+  places = _load_places()
+  state = (state or '').strip().upper()
+  city = ' '.join((city or '').split()).lower()
+  return places.get((city, state)) or places.get(('', state))
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+  # Great-circle (haversine) distance
+  lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+  a = (math.sin((lat2 - lat1) / 2) ** 2
+    + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+  return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat, lon, radius_km):
+  # (min_lat, max_lat, min_lon, max_lon) enclosing the circle of radius_km
+  # around a point. Longitude spans the whole range near the poles; boxes
+  # crossing the antimeridian are not split, which is fine for the US.
+  dlat = radius_km / KM_PER_DEGREE
+  spread = math.sin(radius_km / EARTH_RADIUS_KM) / max(math.cos(math.radians(lat)), 1e-12)
+  if abs(lat) + dlat >= 90 or spread >= 1:
+    dlon = 180.0
+  else:
+    dlon = math.degrees(math.asin(spread))
+  if dlon >= 180:
+    return (max(-90.0, lat - dlat), min(90.0, lat + dlat), -180.0, 180.0)
+  return (max(-90.0, lat - dlat), min(90.0, lat + dlat), max(-180.0, lon - dlon), min(180.0, lon + dlon))
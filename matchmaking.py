@@ -0,0 +1,251 @@
+import threading
+from collections import namedtuple
+from datetime import timedelta
+
+import numpy
+
+from app import db
+from models import Venue, Artist, Show, GENRES
+import geo
+
+# Weights of the genre, location and booking history parts of a match score
+GENRE_WEIGHT = 0.6
+LOCATION_WEIGHT = 0.3
+HISTORY_WEIGHT = 0.1
+
+# Distance at which the location part of a score reaches zero for
+# candidates outside the entity's state
+LOCATION_RANGE_KM = 500
+
+# Past shows together at which the history part of a score is full
+HISTORY_SHOWS = 3
+
+# How far before the newest updated_at seen a refresh re-reads rows, so a
+# write that committed after a newer one is still picked up
+REFRESH_OVERLAP = timedelta(minutes=5)
+
+_genre_bits = {genre: 1 << position for position, genre in enumerate(GENRES)}
+_genre_lock = threading.Lock()
+
+# Integer codes of lowercased city and uppercased state names, so places
+# compare as arrays
+_place_codes = {}
+_place_lock = threading.Lock()
+
+# Set bits of every byte value, for counting the bits of uint64 words
+_BYTE_BITS = numpy.array([bin(byte).count('1') for byte in range(256)], dtype=numpy.uint8)
+
+
+def genre_mask(genres):
+  # Bitset of a genre list; genres outside the form choices get their own
+  # bits as they are first seen.
+  mask = 0
+  for genre in genres or []:
+    bit = _genre_bits.get(genre)
+    if bit is None:
+      with _genre_lock:
+        bit = _genre_bits.setdefault(genre, 1 << len(_genre_bits))
+    mask |= bit
+  return mask
+
+
+def genre_words(mask, width):
+  # A genre bitset as `width` 64-bit words, lowest first
+  return [(mask >> (64 * word)) & 0xFFFFFFFFFFFFFFFF for word in range(width)]
+
+
+def popcount(words):
+  # Set bits in each row of a 2-D uint64 array
+  words = numpy.ascontiguousarray(words)
+  return _BYTE_BITS[words.view(numpy.uint8)].reshape(len(words), -1).sum(axis=1, dtype=numpy.int64)
+
+
+def place_code(name):
+  code = _place_codes.get(name)
+  if code is None:
+    with _place_lock:
+      code = _place_codes.setdefault(name, len(_place_codes))
+  return code
+
+
+def distances_km(lat, lon, latitudes, longitudes):
+  # geo.distance_km from one point to arrays of points; NaN where a point
+  # is unknown
+  lat, lon = numpy.radians(lat), numpy.radians(lon)
+  latitudes, longitudes = numpy.radians(latitudes), numpy.radians(longitudes)
+  a = (numpy.sin((latitudes - lat) / 2) ** 2
+    + numpy.cos(lat) * numpy.cos(latitudes) * numpy.sin((longitudes - lon) / 2) ** 2)
+  return 2 * geo.EARTH_RADIUS_KM * numpy.arcsin(numpy.minimum(1.0, numpy.sqrt(a)))
+
+
+# One row per entity, at positions[entity_id]: genre bitsets as uint64
+# words and their number of genres, city and state codes, coordinates (NaN
+# when unknown) and the seeking flag
+FeatureTable = namedtuple('FeatureTable', 'positions ids masks genre_counts cities states latitudes longitudes seeking')
+
+
+def _empty_table():
+  return FeatureTable({}, numpy.zeros(0, numpy.int64), numpy.zeros((0, 1), numpy.uint64),
+    numpy.zeros(0, numpy.int64), numpy.zeros(0, numpy.int64), numpy.zeros(0, numpy.int64), numpy.zeros(0),
+    numpy.zeros(0), numpy.zeros(0, bool))
+
+
+class MatchIndex:
+  # In-process NumPy table of one model's match features, so a candidate
+  # set is scored with a handful of array operations. refresh() brings it
+  # up to date from the rows changed since the last refresh and swaps in an
+  # updated copy, so readers take `table` as a consistent snapshot without
+  # locking or copying.
+
+  def __init__(self, model, seeking):
+    self.model = model
+    self.seeking_column = seeking
+    self.lock = threading.Lock()
+    self.reset()
+
+  def reset(self):
+    self.table = _empty_table()
+    self.seen = (0, None)
+
+  def _columns(self):
+    model = self.model
+    return (model.id, model.genres, model.city, model.state, model.latitude, model.longitude,
+      self.seeking_column, model.updated_at)
+
+  @staticmethod
+  def _apply(table, rows):
+    # A copy of `table` with `rows` added or updated
+    positions = dict(table.positions)
+    changed = []
+    for entity_id, genres, city, state, latitude, longitude, seeking, _ in rows:
+      known = latitude is not None and longitude is not None
+      changed.append((
+        positions.setdefault(entity_id, len(positions)),
+        entity_id,
+        genre_mask(genres),
+        place_code((city or '').strip().lower()),
+        place_code((state or '').upper()),
+        latitude if known else numpy.nan,
+        longitude if known else numpy.nan,
+        bool(seeking)
+      ))
+    if not changed:
+      return table
+
+    size = len(positions)
+    width = max([table.masks.shape[1]] + [-(-row[2].bit_length() // 64) for row in changed])
+
+    def grown(array, fill=0):
+      copy = numpy.full((size,) + array.shape[1:], fill, dtype=array.dtype)
+      copy[:len(array)] = array
+      return copy
+
+    masks = numpy.zeros((size, width), numpy.uint64)
+    masks[:len(table.masks), :table.masks.shape[1]] = table.masks
+    updated = FeatureTable(positions, grown(table.ids), masks, grown(table.genre_counts), grown(table.cities),
+      grown(table.states), grown(table.latitudes, numpy.nan), grown(table.longitudes, numpy.nan),
+      grown(table.seeking))
+
+    rows = list(zip(*changed))
+    at = numpy.array(rows[0])
+    updated.ids[at] = rows[1]
+    updated.masks[at] = numpy.array([genre_words(mask, width) for mask in rows[2]], numpy.uint64)
+    updated.genre_counts[at] = [bin(mask).count('1') for mask in rows[2]]
+    updated.cities[at] = rows[3]
+    updated.states[at] = rows[4]
+    updated.latitudes[at] = rows[5]
+    updated.longitudes[at] = rows[6]
+    updated.seeking[at] = rows[7]
+    return updated
+
+  def refresh(self):
+    # One query when nothing changed; otherwise reads only the rows updated
+    # since the last refresh, or everything again after a delete.
+    model = self.model
+    count, updated_at = db.session.query(db.func.count(model.id), db.func.max(model.updated_at)).one()
+    with self.lock:
+      if (count, updated_at) == self.seen:
+        return
+      query = db.session.query(*self._columns())
+      table = self.table
+      if self.seen[1] is not None and count >= len(table.ids):
+        table = self._apply(table, query.filter(model.updated_at >= self.seen[1] - REFRESH_OVERLAP))
+      if len(table.ids) != count or self.seen[1] is None:
+        table = self._apply(_empty_table(), query)
+      self.table = table
+      self.seen = (count, updated_at)
+
+
+_indexes = {
+  Venue: MatchIndex(Venue, Venue.seeking_talent),
+  Artist: MatchIndex(Artist, Artist.seeking_venue),
+}
+
+
+def _location_scores(table, position, candidates):
+  # 1 for the same city, at least 0.5 for the same state, otherwise
+  # decaying with distance up to LOCATION_RANGE_KM
+  nearby = numpy.zeros(len(candidates.ids))
+  if not numpy.isnan(table.latitudes[position]):
+    distances = distances_km(table.latitudes[position], table.longitudes[position],
+      candidates.latitudes, candidates.longitudes)
+    nearby = numpy.nan_to_num(numpy.maximum(0.0, 1 - distances / LOCATION_RANGE_KM))
+  state = table.states[position]
+  if state == place_code(''):
+    return nearby
+  same_state = candidates.states == state
+  same_city = same_state & (candidates.cities == table.cities[position])
+  return numpy.where(same_city, 1.0, numpy.where(same_state, numpy.maximum(0.5, nearby), nearby))
+
+
+def recommend(entity, entity_id, limit=10):
+  # Ranks the seeking candidates of the other kind for a venue or artist by
+  # genre overlap (Jaccard of genre bitsets), location and past shows
+  # together, scoring all candidates at once on the feature tables.
+  # Candidates sharing no genre are skipped. Returns None for an unknown
+  # entity.
+  other = Artist if entity is Venue else Venue
+  _indexes[entity].refresh()
+  _indexes[other].refresh()
+  table, candidates = _indexes[entity].table, _indexes[other].table
+  position = table.positions.get(entity_id)
+  if position is None:
+    return None
+
+  own_fk, other_fk = (Show.venue_id, Show.artist_id) if entity is Venue else (Show.artist_id, Show.venue_id)
+  history = dict(db.session.query(other_fk, db.func.count(Show.id)).filter(own_fk == entity_id).group_by(other_fk))
+
+  top = []
+  if table.masks[position].any() and len(candidates.ids):
+    width = max(table.masks.shape[1], candidates.masks.shape[1])
+    mask = numpy.zeros(width, numpy.uint64)
+    mask[:table.masks.shape[1]] = table.masks[position]
+    masks = candidates.masks
+    if masks.shape[1] < width:
+      masks = numpy.pad(masks, ((0, 0), (0, width - masks.shape[1])))
+
+    shared = popcount(masks & mask)
+    genre = shared / (candidates.genre_counts + table.genre_counts[position] - shared)
+    location = _location_scores(table, position, candidates)
+    shows = numpy.zeros(len(candidates.ids))
+    for other_id, count in history.items():
+      if other_id in candidates.positions:
+        shows[candidates.positions[other_id]] = count
+    together = numpy.minimum(1.0, shows / HISTORY_SHOWS)
+    score = GENRE_WEIGHT * genre + LOCATION_WEIGHT * location + HISTORY_WEIGHT * together
+
+    eligible = numpy.flatnonzero((shared > 0) & candidates.seeking)
+    ranked = eligible[numpy.lexsort((candidates.ids[eligible], -score[eligible]))[:limit]]
+    top = [(float(score[at]), int(candidates.ids[at]), float(genre[at]), float(location[at]), float(together[at]))
+      for at in ranked]
+
+  names = dict(db.session.query(other.id, other.name).filter(other.id.in_([match[1] for match in top])))
+  prefix = other.__tablename__
+  return [{
+    prefix + "_id": other_id,
+    prefix + "_name": names.get(other_id),
+    "score": round(score, 4),
+    "genre_score": round(genre, 4),
+    "location_score": round(location, 4),
+    "history_score": round(together, 4)
+  } for score, other_id, genre, location, together in top]
@@ -0,0 +1,27 @@
+"""add show and venue lookup indexes
+
+Revision ID: 3b1f0c9d2e47
+Revises: 8f7863086a9b
+Create Date: 2026-10-18 09:12:40.512338
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3b1f0c9d2e47'
+down_revision = '8f7863086a9b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_show_venue_id_start_time', 'show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_show_artist_id_start_time', 'show', ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_venue_city_state', 'venue', ['city', 'state'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_venue_city_state', table_name='venue')
+    op.drop_index('ix_show_artist_id_start_time', table_name='show')
+    op.drop_index('ix_show_venue_id_start_time', table_name='show')
@@ -0,0 +1,38 @@
+"""add trigram-indexed search documents to venue and artist
+
+Revision ID: 5c2a7e81f930
+Revises: 3b1f0c9d2e47
+Create Date: 2026-10-18 10:02:17.204913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c2a7e81f930'
+down_revision = '3b1f0c9d2e47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in ('venue', 'artist'):
+        op.add_column(table, sa.Column('search_document', sa.Text(), nullable=True))
+        op.execute(
+            "UPDATE {} SET search_document = lower("
+            "coalesce(name, '') || E'\\n' || "
+            "coalesce(city, '') || ', ' || coalesce(state, '') || E'\\n' || "
+            "coalesce(array_to_string(genres, ' '), ''))".format(table)
+        )
+        op.create_index(
+            'ix_{}_search_document'.format(table), table, ['search_document'], unique=False,
+            postgresql_using='gin', postgresql_ops={'search_document': 'gin_trgm_ops'}
+        )
+
+
+def downgrade():
+    for table in ('artist', 'venue'):
+        op.drop_index('ix_{}_search_document'.format(table), table_name=table)
+        op.drop_column(table, 'search_document')
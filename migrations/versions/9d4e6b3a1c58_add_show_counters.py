@@ -0,0 +1,45 @@
+"""add materialized show counters to venue and artist
+
+Revision ID: 9d4e6b3a1c58
+Revises: 5c2a7e81f930
+Create Date: 2026-10-18 11:20:44.871025
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4e6b3a1c58'
+down_revision = '5c2a7e81f930'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('counter_watermark',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rolled_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_show_start_time_id', 'show', ['start_time', 'id'], unique=False)
+
+    op.execute('INSERT INTO counter_watermark (id, rolled_at) VALUES (1, LOCALTIMESTAMP)')
+    for table, column in (('venue', 'venue_id'), ('artist', 'artist_id')):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.execute(
+            'UPDATE {table} SET '
+            'upcoming_shows_count = (SELECT count(*) FROM show WHERE show.{column} = {table}.id '
+            'AND show.start_time > (SELECT rolled_at FROM counter_watermark)), '
+            'past_shows_count = (SELECT count(*) FROM show WHERE show.{column} = {table}.id '
+            'AND show.start_time <= (SELECT rolled_at FROM counter_watermark))'.format(table=table, column=column)
+        )
+
+
+def downgrade():
+    for table in ('artist', 'venue'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
+    op.drop_index('ix_show_start_time_id', table_name='show')
+    op.drop_table('counter_watermark')
@@ -0,0 +1,49 @@
+"""add latitude and longitude to venue and artist
+
+Revision ID: a8d3f51c7e26
+Revises: f6b2d8e41a93
+Create Date: 2026-10-18 17:05:12.661034
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+import geo
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8d3f51c7e26'
+down_revision = 'f6b2d8e41a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    connection = op.get_bind()
+    for table in ('venue', 'artist'):
+        op.add_column(table, sa.Column('latitude', sa.Float(), nullable=True))
+        op.add_column(table, sa.Column('longitude', sa.Float(), nullable=True))
+
+        # Geocode each distinct (city, state) once from the bundled table
+        entities = sa.table(
+            table, sa.column('city', sa.String), sa.column('state', sa.String),
+            sa.column('latitude', sa.Float), sa.column('longitude', sa.Float)
+        )
+        places = connection.execute(sa.select(entities.c.city, entities.c.state).distinct()).fetchall()
+        for city, state in places:
+            point = geo.geocode(city, state)
+            if point is not None:
+                connection.execute(
+                    entities.update().where(
+                        entities.c.city == city, entities.c.state == state
+                    ).values(latitude=point[0], longitude=point[1])
+                )
+
+        op.create_index('ix_{}_latitude_longitude'.format(table), table, ['latitude', 'longitude'], unique=False)
+
+
+def downgrade():
+    for table in ('artist', 'venue'):
+        op.drop_index('ix_{}_latitude_longitude'.format(table), table_name=table)
+        op.drop_column(table, 'longitude')
+        op.drop_column(table, 'latitude')
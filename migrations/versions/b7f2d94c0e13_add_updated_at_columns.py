@@ -0,0 +1,32 @@
+"""add updated_at to venue, artist and show
+
+Revision ID: b7f2d94c0e13
+Revises: 9d4e6b3a1c58
+Create Date: 2026-10-18 12:41:09.338150
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7f2d94c0e13'
+down_revision = '9d4e6b3a1c58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venue', 'artist', 'show'):
+        op.add_column(table, sa.Column(
+            'updated_at', sa.DateTime(), nullable=False,
+            server_default=sa.text("timezone('utc', now())")
+        ))
+        op.alter_column(table, 'updated_at', server_default=None)
+        op.create_index('ix_{}_updated_at'.format(table), table, ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in ('show', 'artist', 'venue'):
+        op.drop_index('ix_{}_updated_at'.format(table), table_name=table)
+        op.drop_column(table, 'updated_at')
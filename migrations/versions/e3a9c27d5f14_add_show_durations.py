@@ -0,0 +1,39 @@
+"""add show durations and overlap constraints
+
+Revision ID: e3a9c27d5f14
+Revises: b7f2d94c0e13
+Create Date: 2026-10-18 15:02:37.514208
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3a9c27d5f14'
+down_revision = 'b7f2d94c0e13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.add_column('show', sa.Column('duration', sa.Integer(), nullable=False, server_default='120'))
+    op.add_column('show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    op.execute('UPDATE "show" SET end_time = start_time + duration * interval \'1 minute\'')
+    op.alter_column('show', 'end_time', nullable=False)
+    op.create_check_constraint('ck_show_duration', 'show', 'duration BETWEEN 1 AND 720')
+    # Fails if existing shows already overlap; resolve those bookings first.
+    for column in ('venue_id', 'artist_id'):
+        op.execute(
+            'ALTER TABLE "show" ADD CONSTRAINT ex_show_{0}_overlap '
+            'EXCLUDE USING gist ({0} WITH =, tsrange(start_time, end_time) WITH &&)'.format(column)
+        )
+
+
+def downgrade():
+    for column in ('artist_id', 'venue_id'):
+        op.drop_constraint('ex_show_{}_overlap'.format(column), 'show')
+    op.drop_constraint('ck_show_duration', 'show', type_='check')
+    op.drop_column('show', 'end_time')
+    op.drop_column('show', 'duration')
@@ -0,0 +1,52 @@
+"""normalize genres and index them with GIN
+
+Revision ID: f6b2d8e41a93
+Revises: e3a9c27d5f14
+Create Date: 2026-10-18 16:20:48.907311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6b2d8e41a93'
+down_revision = 'e3a9c27d5f14'
+branch_labels = None
+depends_on = None
+
+# The genre choices of forms.py when this revision was written
+GENRES = [
+    'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk',
+    'Hip-Hop', 'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre', 'Pop',
+    'Punk', 'R&B', 'Reggae', 'Rock n Roll', 'Soul', 'Other',
+]
+
+
+def normalize(genres):
+    canonical = {genre.lower(): genre for genre in GENRES}
+    normalized = []
+    for genre in genres or []:
+        genre = ' '.join(genre.split())
+        genre = canonical.get(genre.lower(), genre)
+        if genre and genre not in normalized:
+            normalized.append(genre)
+    return normalized
+
+
+def upgrade():
+    connection = op.get_bind()
+    for table in ('venue', 'artist'):
+        entities = sa.table(table, sa.column('id', sa.Integer), sa.column('genres', postgresql.ARRAY(sa.String)))
+        for entity_id, genres in connection.execute(sa.select(entities.c.id, entities.c.genres)).fetchall():
+            if normalize(genres) != list(genres or []):
+                connection.execute(
+                    entities.update().where(entities.c.id == entity_id).values(genres=normalize(genres))
+                )
+        op.create_index('ix_{}_genres'.format(table), table, ['genres'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    for table in ('artist', 'venue'):
+        op.drop_index('ix_{}_genres'.format(table), table_name=table)
@@ -1,7 +1,52 @@
+from datetime import datetime, timedelta
+
 from app import db
+from forms import VenueForm
+import geo
+
+
+# Show lengths in minutes. The upper bound lets a conflict check scan a
+# bounded start_time range of the (venue_id, start_time) index.
+DEFAULT_SHOW_DURATION = 120
+MAX_SHOW_DURATION = 12 * 60
+
+
+GENRES = [value for value, _ in VenueForm.genres.kwargs['choices']]
+_CANONICAL_GENRES = {genre.lower(): genre for genre in GENRES}
+
+
+def normalize_genres(genres):
+  # Genres in their canonical spelling from the form choices, matched
+  # case- and whitespace-insensitively, each once and in the order given.
+  # Values outside the choices are kept, trimmed.
+  normalized = []
+  for genre in genres or []:
+    genre = ' '.join(genre.split())
+    genre = _CANONICAL_GENRES.get(genre.lower(), genre)
+    if genre and genre not in normalized:
+      normalized.append(genre)
+  return normalized
+
+
+def search_document(name, city, state, genres):
+  # Lower-cased text that venue and artist search match against
+  return '\n'.join([
+    name or '',
+    '%s, %s' % (city or '', state or ''),
+    ' '.join(genres or [])
+  ]).lower()
+
 
 class Venue(db.Model):
   __tablename__ = 'venue'
+  __table_args__ = (
+    db.Index('ix_venue_city_state', 'city', 'state'),
+    db.Index('ix_venue_updated_at', 'updated_at'),
+    db.Index('ix_venue_search_document', 'search_document',
+      postgresql_using='gin', postgresql_ops={'search_document': 'gin_trgm_ops'}),
+    db.Index('ix_venue_genres', 'genres', postgresql_using='gin'),
+    db.Index('ix_venue_latitude_longitude', 'latitude', 'longitude'),
+  )
 
   id = db.Column(db.Integer, primary_key=True)
   name = db.Column(db.String)
@@ -9,12 +54,18 @@ class Venue(db.Model):
   state = db.Column(db.String(120))
   address = db.Column(db.String(120))
   phone = db.Column(db.String(120))
-  genres = db.Column(db.ARRAY(db.String))
+  genres = db.Column(db.ARRAY(db.String).with_variant(db.JSON, 'sqlite'))
   facebook_link = db.Column(db.String(120))
   image_link = db.Column(db.String(500))
   website_link = db.Column(db.String(200))
   seeking_talent = db.Column(db.Boolean,default = False)
   seeking_description = db.Column(db.String(1000))
+  search_document = db.Column(db.Text)
+  latitude = db.Column(db.Float)
+  longitude = db.Column(db.Float)
+  upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+  past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+  updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
   shows = db.relationship('Show',backref = 'venue')
 
   def __repr__(self):
@@ -24,18 +75,31 @@ class Venue(db.Model):
 class Artist(db.Model):
 
   __tablename__ = 'artist'
+  __table_args__ = (
+    db.Index('ix_artist_updated_at', 'updated_at'),
+    db.Index('ix_artist_search_document', 'search_document',
+      postgresql_using='gin', postgresql_ops={'search_document': 'gin_trgm_ops'}),
+    db.Index('ix_artist_genres', 'genres', postgresql_using='gin'),
+    db.Index('ix_artist_latitude_longitude', 'latitude', 'longitude'),
+  )
 
   id = db.Column(db.Integer, primary_key=True)
   name = db.Column(db.String)
   city = db.Column(db.String(120))
   state = db.Column(db.String(120))
   phone = db.Column(db.String(120))
-  genres = db.Column(db.ARRAY(db.String))
+  genres = db.Column(db.ARRAY(db.String).with_variant(db.JSON, 'sqlite'))
   facebook_link = db.Column(db.String(120))
   image_link = db.Column(db.String(500))
   website_link = db.Column(db.String(200))
   seeking_venue = db.Column(db.Boolean, default = False)
   seeking_description = db.Column(db.String(1000))
+  search_document = db.Column(db.Text)
+  latitude = db.Column(db.Float)
+  longitude = db.Column(db.Float)
+  upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+  past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+  updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
   shows = db.relationship('Show',backref = 'artist')
 
   def __repr__(self):
@@ -44,8 +108,75 @@ class Artist(db.Model):
 
 class Show(db.Model):
   __tablename__  = 'show'
+  __table_args__ = (
+    db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+    db.Index('ix_show_start_time_id', 'start_time', 'id'),
+    db.Index('ix_show_updated_at', 'updated_at'),
+    db.CheckConstraint('duration BETWEEN 1 AND %d' % MAX_SHOW_DURATION, name='ck_show_duration'),
+  )
 
   id = db.Column(db.Integer,primary_key = True)
   artist_id = db.Column(db.Integer,db.ForeignKey('artist.id'),nullable = False)
   venue_id = db.Column(db.Integer,db.ForeignKey('venue.id'),nullable = False)
   start_time = db.Column(db.DateTime,nullable = False)
+  duration = db.Column(db.Integer, nullable=False, default=DEFAULT_SHOW_DURATION, server_default=str(DEFAULT_SHOW_DURATION))
+  end_time = db.Column(db.DateTime, nullable=False)
+  updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class CounterWatermark(db.Model):
+  # Single row holding the time up to which shows have been moved from the
+  # upcoming to the past counters of their venue and artist.
+  __tablename__ = 'counter_watermark'
+
+  id = db.Column(db.Integer, primary_key=True)
+  rolled_at = db.Column(db.DateTime, nullable=False)
+
+
+@db.event.listens_for(Venue, 'before_insert')
+@db.event.listens_for(Venue, 'before_update')
+@db.event.listens_for(Artist, 'before_insert')
+@db.event.listens_for(Artist, 'before_update')
+def update_derived_columns(mapper, connection, target):
+  target.genres = normalize_genres(target.genres)
+  state = db.inspect(target)
+  located = state.attrs.latitude.history.has_changes() or state.attrs.longitude.history.has_changes()
+  moved = state.attrs.city.history.has_changes() or state.attrs.state.history.has_changes()
+  if moved and not located:
+    target.latitude, target.longitude = geo.geocode(target.city, target.state) or (None, None)
+  target.search_document = search_document(target.name, target.city, target.state, target.genres)
+
+
+def show_end_time(start_time, duration):
+  return start_time + timedelta(minutes=duration or DEFAULT_SHOW_DURATION)
+
+
+@db.event.listens_for(Show, 'before_insert')
+@db.event.listens_for(Show, 'before_update')
+def update_end_time(mapper, connection, target):
+  target.duration = target.duration or DEFAULT_SHOW_DURATION
+  target.end_time = show_end_time(target.start_time, target.duration)
+
+
+db.event.listen(
+  db.metadata, 'before_create',
+  db.DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
+db.event.listen(
+  db.metadata, 'before_create',
+  db.DDL('CREATE EXTENSION IF NOT EXISTS btree_gist').execute_if(dialect='postgresql')
+)
+
+
+def _no_overlap(column):
+  # Postgres refuses overlapping shows for the same venue or artist itself;
+  # scheduling.py checks with a range query first everywhere else.
+  return db.DDL(
+    'ALTER TABLE "show" ADD CONSTRAINT ex_show_{0}_overlap '
+    'EXCLUDE USING gist ({0} WITH =, tsrange(start_time, end_time) WITH &&)'.format(column)
+  ).execute_if(dialect='postgresql')
+
+
+db.event.listen(Show.__table__, 'after_create', _no_overlap('venue_id'))
+db.event.listen(Show.__table__, 'after_create', _no_overlap('artist_id'))
@@ -0,0 +1,176 @@
+import contextlib
+import logging
+import re
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Whitespace runs and expanded IN lists, collapsed so statements that differ
+# only in how many ids they carry share a shape
+_WHITESPACE = re.compile(r'\s+')
+_PARAM = r'(?:\?|%s|%\(\w+\)s)'
+_IN_LIST = re.compile(r'\bIN \(%s(?:, %s)*\)' % (_PARAM, _PARAM), re.IGNORECASE)
+
+
+def statement_shape(statement):
+  return _IN_LIST.sub('IN (?)', _WHITESPACE.sub(' ', statement).strip())
+
+
+class QueryBudgetExceeded(AssertionError):
+  pass
+
+
+class QueryStats:
+  # Queries issued during one request or one max_queries() block
+
+  def __init__(self):
+    self.count = 0
+    self.seconds = 0.0
+    self.shapes = Counter()
+
+  def record(self, statement, seconds):
+    self.count += 1
+    self.seconds += seconds
+    self.shapes[statement_shape(statement)] += 1
+
+  def repeated(self, threshold):
+    # Statement shapes run at least `threshold` times, the mark of a query
+    # issued once per row of an earlier result (N+1)
+    return {shape: count for shape, count in self.shapes.items() if count >= threshold}
+
+
+def query_budget(limit):
+  # Caps the number of queries a view may issue per request
+  def decorator(view):
+    view.query_budget = limit
+    return view
+  return decorator
+
+
+class QueryProfiler:
+  # Counts the queries, database time and repeated statement shapes of each
+  # request from SQLAlchemy engine events. Adds them to the response as
+  # X-Query-Count / X-Query-Time / X-Query-Repeats and a Server-Timing entry
+  # (shown by browser dev tools), keeps per-endpoint totals for
+  # /metrics/queries, logs likely N+1 patterns, and checks query budgets.
+  # Streamed responses get no headers, as their queries run after the
+  # headers are sent; they count towards the rest when they close.
+
+  def __init__(self, app=None):
+    self.lock = threading.Lock()
+    self.local = threading.local()
+    self.totals = {}
+    self.repeat_threshold = 5
+    self.budget = None
+    self.strict = None
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    self.repeat_threshold = app.config.get('SQL_REPEAT_THRESHOLD', 5)
+    self.budget = app.config.get('SQL_QUERY_BUDGET')
+    self.strict = app.config.get('SQL_QUERY_BUDGET_STRICT')
+    app.extensions['query_profiler'] = self
+    if not app.config.get('SQL_PROFILER', True):
+      return
+    event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+    app.before_request(self._start_request)
+    app.after_request(self._finish_request)
+
+  def _collectors(self):
+    collectors = list(getattr(self.local, 'blocks', ()))
+    if has_app_context() and 'query_stats' in g:
+      collectors.append(g.query_stats)
+    return collectors
+
+  def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+  def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    elapsed = time.perf_counter() - started
+    for stats in self._collectors():
+      stats.record(statement, elapsed)
+
+  def _start_request(self):
+    g.query_stats = QueryStats()
+
+  def _finish_request(self, response):
+    stats = g.get('query_stats')
+    if stats is None:
+      return response
+
+    endpoint = request.endpoint or '<unmatched>'
+    budget = getattr(current_app.view_functions.get(request.endpoint), 'query_budget', None)
+    if budget is None:
+      budget = self.budget
+    strict = current_app.testing if self.strict is None else self.strict
+    if response.is_streamed:
+      # A streamed body runs its queries while it is sent, after the headers
+      # have gone, so they are only counted once the response closes
+      path = request.path
+      response.call_on_close(lambda: self._record(stats, endpoint, path, budget, strict))
+      return response
+
+    g.pop('query_stats')
+    response.headers['X-Query-Count'] = str(stats.count)
+    response.headers['X-Query-Time'] = '%.3f' % (stats.seconds * 1000)
+    response.headers['X-Query-Repeats'] = str(len(stats.repeated(self.repeat_threshold)))
+    response.headers.add('Server-Timing', 'db;dur=%.3f;desc="%d queries"' % (stats.seconds * 1000, stats.count))
+    self._record(stats, endpoint, request.path, budget, strict)
+    return response
+
+  def _record(self, stats, endpoint, path, budget, strict):
+    # Adds a finished request to the per-endpoint totals, logs its likely
+    # N+1 patterns and checks its query budget
+    repeated = stats.repeated(self.repeat_threshold)
+    with self.lock:
+      totals = self.totals.setdefault(endpoint, {
+        "requests": 0, "queries": 0, "db_ms": 0.0, "max_queries": 0, "repeated_requests": 0
+      })
+      totals['requests'] += 1
+      totals['queries'] += stats.count
+      totals['db_ms'] += stats.seconds * 1000
+      totals['max_queries'] = max(totals['max_queries'], stats.count)
+      totals['repeated_requests'] += bool(repeated)
+
+    for shape, count in repeated.items():
+      logger.warning('Possible N+1 on %s: %d x %s', path, count, shape)
+
+    if budget is not None and stats.count > budget:
+      message = '%s issued %d queries, over its budget of %d' % (path, stats.count, budget)
+      # Over-budget requests fail outright under test, and are logged otherwise
+      if strict:
+        raise QueryBudgetExceeded(message)
+      logger.warning(message)
+
+  @contextlib.contextmanager
+  def max_queries(self, limit):
+    # For tests: fails the block if it issues more than `limit` queries.
+    #
+    #   with profiler.max_queries(2):
+    #     client.get('/venues')
+    stats = QueryStats()
+    blocks = self.local.__dict__.setdefault('blocks', [])
+    blocks.append(stats)
+    try:
+      yield stats
+    finally:
+      blocks.remove(stats)
+    if stats.count > limit:
+      raise QueryBudgetExceeded('%d queries issued, over the budget of %d:\n%s' % (
+        stats.count, limit, '\n'.join('%d x %s' % (count, shape) for shape, count in stats.shapes.most_common())))
+
+  def stats(self):
+    with self.lock:
+      return {
+        endpoint: dict(totals, db_ms=round(totals['db_ms'], 3))
+        for endpoint, totals in self.totals.items()
+      }
@@ -0,0 +1,433 @@
+import calendar
+import json
+from datetime import date, datetime, timedelta
+
+from sqlalchemy.dialects import postgresql
+
+from app import db
+import geo
+from models import Venue, Artist, Show, CounterWatermark, normalize_genres
+
+
+VENUE_COLUMNS = (
+  Venue.id, Venue.name, Venue.genres, Venue.address, Venue.city, Venue.state,
+  Venue.phone, Venue.website_link, Venue.facebook_link, Venue.seeking_talent,
+  Venue.seeking_description, Venue.image_link, Venue.latitude, Venue.longitude,
+  Venue.upcoming_shows_count, Venue.past_shows_count
+)
+
+ARTIST_COLUMNS = (
+  Artist.id, Artist.name, Artist.genres, Artist.city, Artist.state,
+  Artist.phone, Artist.website_link, Artist.facebook_link, Artist.seeking_venue,
+  Artist.seeking_description, Artist.image_link, Artist.latitude, Artist.longitude,
+  Artist.upcoming_shows_count, Artist.past_shows_count
+)
+
+SHOW_COLUMNS = (
+  Show.id, Show.start_time, Show.duration, Show.venue_id, Venue.name.label('venue_name'),
+  Show.artist_id, Artist.name.label('artist_name'),
+  Artist.image_link.label('artist_image_link')
+)
+
+CATALOG_COLUMNS = {
+  "venues": VENUE_COLUMNS,
+  "artists": ARTIST_COLUMNS,
+  "shows": SHOW_COLUMNS,
+}
+
+
+def catalog_query(kind):
+  # Every venue, artist or show (with its venue and artist names) in a stable
+  # order, for the API listings and exports.
+  query = db.session.query(*CATALOG_COLUMNS[kind])
+  if kind == 'venues':
+    return query.order_by(Venue.id)
+  if kind == 'artists':
+    return query.order_by(Artist.id)
+  return query.join(
+    Venue, Show.venue_id == Venue.id
+  ).join(
+    Artist, Show.artist_id == Artist.id
+  ).order_by(Show.start_time, Show.id)
+
+
+def has_genre(column, genre):
+  # genres is a text[] on Postgres, where `genres @> ARRAY[genre]` is
+  # answered from the GIN index, and a JSON list elsewhere
+  if db.engine.dialect.name == 'postgresql':
+    return column.op('@>')(db.cast(postgresql.array([genre]), postgresql.ARRAY(db.String)))
+  return db.cast(column, db.Text).contains(json.dumps(genre), autoescape=True)
+
+
+def genre_arg(args):
+  # The canonical spelling of a ?genre= argument, or None
+  genres = normalize_genres([args.get('genre', '')])
+  return genres[0] if genres else None
+
+
+def venue_areas(genre=None):
+  # Venues grouped by (city, state) with their upcoming show counts, read
+  # from the materialized counters in a single query, optionally only
+  # those playing `genre`. An area's version (venue count, newest
+  # updated_at) changes whenever its list of venues does.
+  query = db.session.query(
+    Venue.id,
+    Venue.name,
+    Venue.city,
+    Venue.state,
+    Venue.upcoming_shows_count,
+    Venue.updated_at
+  )
+  if genre:
+    query = query.filter(has_genre(Venue.genres, genre))
+  rows = query.order_by(
+    Venue.state, Venue.city, Venue.name, Venue.id
+  ).all()
+
+  areas = []
+  for venue_id, name, city, state, num_upcoming_shows, updated_at in rows:
+    if not areas or (areas[-1]['city'], areas[-1]['state']) != (city, state):
+      areas.append({
+        "city": city,
+        "state": state,
+        "venues": [],
+        "version": (0, updated_at)
+      })
+    area = areas[-1]
+    area['venues'].append({
+      "id": venue_id,
+      "name": name,
+      "num_upcoming_shows": num_upcoming_shows
+    })
+    area['version'] = (len(area['venues']), max(area['version'][1], updated_at))
+
+  return areas
+
+
+def find_venues_near(lat, lon, radius_km, limit=50):
+  # Venues within radius_km of a point, nearest first, with their distance.
+  # The bounding box of the circle is a range condition on the
+  # (latitude, longitude) index, so only nearby venues are read; the exact
+  # great-circle distance is then checked on those.
+  min_lat, max_lat, min_lon, max_lon = geo.bounding_box(lat, lon, radius_km)
+  rows = db.session.query(
+    Venue.id,
+    Venue.name,
+    Venue.city,
+    Venue.state,
+    Venue.upcoming_shows_count,
+    Venue.latitude,
+    Venue.longitude
+  ).filter(
+    Venue.latitude.between(min_lat, max_lat),
+    Venue.longitude.between(min_lon, max_lon)
+  ).all()
+
+  venues = []
+  for venue_id, name, city, state, num_upcoming_shows, latitude, longitude in rows:
+    distance = geo.distance_km(lat, lon, latitude, longitude)
+    if distance <= radius_km:
+      venues.append({
+        "id": venue_id,
+        "name": name,
+        "city": city,
+        "state": state,
+        "num_upcoming_shows": num_upcoming_shows,
+        "distance_km": round(distance, 1)
+      })
+  venues.sort(key=lambda venue: (venue['distance_km'], venue['id']))
+  return venues[:limit]
+
+
+def near_args(args, default_radius, max_radius):
+  # (lat, lon, radius_km) from ?lat=&lon=&radius= or ?city=&state=, or
+  # None when no usable point was given
+  lat = args.get('lat', type=float)
+  lon = args.get('lon', type=float)
+  if lat is None or lon is None:
+    lat, lon = geo.geocode(args.get('city'), args.get('state')) or (None, None)
+  if lat is None or not -90 <= lat <= 90 or not -180 <= lon <= 180:
+    return None
+  radius = args.get('radius', default_radius, type=float)
+  return lat, lon, min(max(radius, 0.0), max_radius)
+
+
+def encode_cursor(start_time, show_id):
+  return '{}~{}'.format(start_time.strftime('%Y-%m-%dT%H:%M:%S.%f'), show_id)
+
+
+def decode_cursor(cursor):
+  # Returns the (start_time, id) key encoded by encode_cursor, or None
+  # when the cursor is missing or malformed.
+  try:
+    start_time, show_id = cursor.split('~')
+    return datetime.strptime(start_time, '%Y-%m-%dT%H:%M:%S.%f'), int(show_id)
+  except (AttributeError, ValueError):
+    return None
+
+
+def filter_shows(query, start=None, end=None, city=None, genre=None):
+  # Narrows a show query joined to Venue and Artist to shows starting in
+  # [start, end), at venues in `city`, where the artist or venue plays
+  # `genre`. The start_time bounds become range conditions on the
+  # (start_time, id) index.
+  if start is not None:
+    query = query.filter(Show.start_time >= start)
+  if end is not None:
+    query = query.filter(Show.start_time < end)
+  if city:
+    query = query.filter(Venue.city == city)
+  if genre:
+    query = query.filter(db.or_(has_genre(Artist.genres, genre), has_genre(Venue.genres, genre)))
+  return query
+
+
+SHOW_FILTERS = ('from', 'to', 'city', 'genre')
+
+
+def show_window(args):
+  # filter_shows() arguments from from/to/city/genre query arguments. A
+  # bare date in `to` includes that whole day; unparseable dates are ignored.
+  def moment(name):
+    try:
+      return datetime.fromisoformat(args.get(name, ''))
+    except ValueError:
+      return None
+
+  end = moment('to')
+  if end is not None and len(args['to']) == 10:
+    end += timedelta(days=1)
+  return {
+    "start": moment('from'),
+    "end": end,
+    "city": args.get('city') or None,
+    "genre": genre_arg(args)
+  }
+
+
+def show_page(after=None, before=None, per_page=30, **filters):
+  # One page of shows ordered by (start_time, id), joined to their artist
+  # and venue and narrowed by filter_shows(). Paging is keyset based so the
+  # cost of a page does not depend on how deep into the listing it is.
+  query = db.session.query(
+    Show.id,
+    Show.start_time,
+    Show.venue_id,
+    Venue.name,
+    Show.artist_id,
+    Artist.name,
+    Artist.image_link,
+    Show.updated_at,
+    Venue.updated_at,
+    Artist.updated_at
+  ).join(
+    Venue, Show.venue_id == Venue.id
+  ).join(
+    Artist, Show.artist_id == Artist.id
+  )
+  query = filter_shows(query, **filters)
+  key = db.tuple_(Show.start_time, Show.id)
+
+  if before:
+    rows = query.filter(key < before).order_by(
+      Show.start_time.desc(), Show.id.desc()
+    ).limit(per_page + 1).all()
+    has_prev = len(rows) > per_page
+    has_next = True
+    rows = rows[:per_page][::-1]
+  else:
+    if after:
+      query = query.filter(key > after)
+    rows = query.order_by(
+      Show.start_time, Show.id
+    ).limit(per_page + 1).all()
+    has_prev = after is not None
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+
+  shows = []
+  for show_id, start_time, venue_id, venue_name, artist_id, artist_name, artist_image_link, *version in rows:
+    shows.append({
+      "id": show_id,
+      "version": tuple(version),
+      "venue_id": venue_id,
+      "venue_name": venue_name,
+      "artist_id": artist_id,
+      "artist_name": artist_name,
+      "artist_image_link": artist_image_link,
+      "start_time": start_time
+    })
+
+  return {
+    "shows": shows,
+    "prev": encode_cursor(rows[0][1], rows[0][0]) if rows and has_prev else None,
+    "next": encode_cursor(rows[-1][1], rows[-1][0]) if rows and has_next else None
+  }
+
+
+def month_calendar(entity, entity_id, month):
+  # The shows of a venue or artist starting in the month of `month` (a date),
+  # laid out as weeks of (day, shows) for a calendar grid. One range query
+  # on the (venue_id, start_time) or (artist_id, start_time) index.
+  if entity is Venue:
+    entity_fk, other, other_fk, prefix = Show.venue_id, Artist, Show.artist_id, 'artist'
+  else:
+    entity_fk, other, other_fk, prefix = Show.artist_id, Venue, Show.venue_id, 'venue'
+
+  first = month.replace(day=1)
+  following = date(first.year + first.month // 12, first.month % 12 + 1, 1)
+  rows = db.session.query(
+    Show.start_time, Show.end_time, other.id, other.name
+  ).join(
+    other, other_fk == other.id
+  ).filter(
+    entity_fk == entity_id,
+    Show.start_time >= first,
+    Show.start_time < following
+  ).order_by(Show.start_time, Show.id).all()
+
+  days = {}
+  for start_time, end_time, other_id, other_name in rows:
+    days.setdefault(start_time.date(), []).append({
+      prefix + "_id": other_id,
+      prefix + "_name": other_name,
+      "start_time": start_time,
+      "end_time": end_time
+    })
+
+  return {
+    "month": first,
+    "prev_month": date(first.year - (first.month == 1), (first.month - 2) % 12 + 1, 1),
+    "next_month": following,
+    "weeks": [
+      [(day, days.get(day, [])) for day in week]
+      for week in calendar.Calendar(calendar.SUNDAY).monthdatescalendar(first.year, first.month)
+    ]
+  }
+
+
+def _entity_with_shows(entity, entity_id, other, now, past_limit, upcoming_limit):
+  # Loads an entity together with its shows and the name and image of the
+  # other side of each show in a single query. Shows are split into past and
+  # upcoming against one reference time and numbered within each section by
+  # a window function, so only the first `limit` rows of a section are
+  # transferred. Section totals come from the entity's show counters, and
+  # `now` defaults to their watermark so lists and totals agree.
+  if entity is Venue:
+    entity_fk, other_fk, prefix = Show.venue_id, Show.artist_id, 'artist'
+  else:
+    entity_fk, other_fk, prefix = Show.artist_id, Show.venue_id, 'venue'
+
+  upcoming = Show.start_time > now
+  shows = db.session.query(
+    entity_fk.label('entity_id'),
+    other_fk.label('other_id'),
+    Show.start_time.label('start_time'),
+    upcoming.label('upcoming'),
+    db.func.row_number().over(
+      partition_by=upcoming,
+      order_by=(db.case((upcoming, Show.start_time)).asc(), Show.start_time.desc())
+    ).label('position')
+  ).filter(entity_fk == entity_id).subquery()
+
+  in_limit = []
+  for section, limit in ((shows.c.upcoming, upcoming_limit), (db.not_(shows.c.upcoming), past_limit)):
+    in_limit.append(section if limit is None else db.and_(section, shows.c.position <= limit))
+
+  rows = db.session.query(
+    entity,
+    shows.c.start_time,
+    shows.c.upcoming,
+    other.id,
+    other.name,
+    other.image_link
+  ).outerjoin(
+    shows, db.and_(shows.c.entity_id == entity.id, db.or_(*in_limit))
+  ).outerjoin(
+    other, other.id == shows.c.other_id
+  ).filter(
+    entity.id == entity_id
+  ).order_by(
+    shows.c.position
+  ).all()
+
+  if not rows:
+    return None
+
+  detail = {
+    "entity": rows[0][0],
+    "past_shows": [],
+    "upcoming_shows": [],
+    "past_shows_count": rows[0][0].past_shows_count,
+    "upcoming_shows_count": rows[0][0].upcoming_shows_count
+  }
+  for _, start_time, is_upcoming, other_id, other_name, other_image_link in rows:
+    if start_time is None:
+      continue
+    section = 'upcoming_shows' if is_upcoming else 'past_shows'
+    detail[section].append({
+      prefix + "_id": other_id,
+      prefix + "_name": other_name,
+      prefix + "_image_link": other_image_link,
+      "start_time": start_time
+    })
+
+  return detail
+
+
+def counted_now():
+  # The watermark's rolled_at, which the show counters and the detail page
+  # versions are measured against, as a subquery so it costs no round trip.
+  # The current time until a first roll.
+  return db.func.coalesce(db.session.query(CounterWatermark.rolled_at).scalar_subquery(), datetime.now())
+
+
+def venue_detail(venue_id, now=None, past_limit=None, upcoming_limit=None):
+  return _entity_with_shows(Venue, venue_id, Artist, now or counted_now(), past_limit, upcoming_limit)
+
+
+def artist_detail(artist_id, now=None, past_limit=None, upcoming_limit=None):
+  return _entity_with_shows(Artist, artist_id, Venue, now or counted_now(), past_limit, upcoming_limit)
+
+
+# Page versions for conditional GETs. Each returns the values the page's
+# content depends on, the last of which is its last modification time, or
+# None when the page does not exist. They only read indexed maxima, row
+# counts of the venue and artist tables and single rows by primary key, so
+# they never touch a venue's or artist's shows. Counter updates touch
+# updated_at; the watermark is mixed in where pages split shows by time.
+# Deleting a row leaves max(updated_at) where it was, so the listings give
+# no modification time and are validated by ETag alone.
+
+def venues_version():
+  count, updated_at = db.session.query(db.func.count(Venue.id), db.func.max(Venue.updated_at)).one()
+  return count, updated_at, None
+
+
+def artists_version():
+  count, updated_at = db.session.query(db.func.count(Artist.id), db.func.max(Artist.updated_at)).one()
+  return count, updated_at, None
+
+
+def shows_version():
+  # Deleting a venue's shows touches their artists, so the three maxima
+  # also change when shows disappear.
+  updated = [
+    db.session.query(db.func.max(model.updated_at)).scalar()
+    for model in (Venue, Artist, Show)
+  ]
+  return tuple(updated) + (max(filter(None, updated), default=None),)
+
+
+def venue_version(venue_id):
+  return db.session.query(
+    db.session.query(CounterWatermark.rolled_at).scalar_subquery(),
+    Venue.updated_at
+  ).filter(Venue.id == venue_id).first()
+
+
+def artist_version(artist_id):
+  return db.session.query(
+    db.session.query(CounterWatermark.rolled_at).scalar_subquery(),
+    Artist.updated_at
+  ).filter(Artist.id == artist_id).first()
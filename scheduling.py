@@ -0,0 +1,107 @@
+import bisect
+from datetime import timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from models import Show, MAX_SHOW_DURATION, show_end_time
+import counters
+
+# Postgres error raised by the ex_show_*_overlap exclusion constraints
+EXCLUSION_VIOLATION = '23P01'
+
+
+class ShowConflict(Exception):
+
+  def __init__(self, conflicts):
+    # conflicts: (column, Show) pairs for the bookings the new show overlaps
+    self.conflicts = conflicts
+    super().__init__(', '.join(
+      '%s %s is booked from %s to %s' % (column[:-3], getattr(show, column), show.start_time, show.end_time)
+      for column, show in conflicts
+    ) or 'The show overlaps an existing booking')
+
+
+def overlapping(column, entity_id, start_time, end_time):
+  # Shows of one venue or artist that overlap [start_time, end_time). The
+  # MAX_SHOW_DURATION bound keeps this a short range scan of the
+  # (venue_id, start_time) / (artist_id, start_time) index.
+  return Show.query.filter(
+    getattr(Show, column) == entity_id,
+    Show.start_time < end_time,
+    Show.start_time > start_time - timedelta(minutes=MAX_SHOW_DURATION),
+    Show.end_time > start_time
+  ).order_by(Show.start_time).all()
+
+
+def book_show(venue_id, artist_id, start_time, duration=None):
+  # Adds a show unless it overlaps another booking of its venue or artist,
+  # raising ShowConflict instead. Runs in the caller's transaction; the
+  # caller commits, or rolls back on ShowConflict.
+  show = Show(venue_id=venue_id, artist_id=artist_id, start_time=start_time, duration=duration)
+  end_time = show_end_time(start_time, duration)
+
+  # Counting the show first updates the venue and artist rows, whose row
+  # locks then serialize concurrent bookings for either of them until
+  # commit, so the check below cannot race another submission.
+  counters.record_show(venue_id, artist_id, start_time)
+
+  conflicts = [
+    (column, existing)
+    for column, entity_id in (('venue_id', venue_id), ('artist_id', artist_id))
+    for existing in overlapping(column, entity_id, start_time, end_time)
+  ]
+  if conflicts:
+    raise ShowConflict(conflicts)
+
+  db.session.add(show)
+  try:
+    db.session.flush()
+  except IntegrityError as e:
+    if getattr(e.orig, 'pgcode', None) == EXCLUSION_VIOLATION:
+      raise ShowConflict([])
+    raise
+  return show
+
+
+def batch_conflicts(shows):
+  # Indexes of the shows in a batch of dicts (venue_id, artist_id,
+  # start_time, end_time) that overlap an existing show or an earlier show
+  # of the batch, read with one query per venue/artist column.
+  if not shows:
+    return {}
+  earliest = min(show['start_time'] for show in shows) - timedelta(minutes=MAX_SHOW_DURATION)
+  latest = max(show['end_time'] for show in shows)
+
+  booked = {}
+  for column in ('venue_id', 'artist_id'):
+    fk = getattr(Show, column)
+    rows = db.session.query(fk, Show.start_time, Show.end_time).filter(
+      fk.in_({show[column] for show in shows}),
+      Show.start_time < latest,
+      Show.start_time > earliest
+    )
+    for entity_id, start_time, end_time in rows:
+      booked.setdefault((column, entity_id), []).append((start_time, end_time))
+  for intervals in booked.values():
+    intervals.sort()
+
+  conflicts = {}
+  for index, show in enumerate(shows):
+    keys = [(column, show[column]) for column in ('venue_id', 'artist_id')]
+    clashes = [column for column, entity_id in keys if _overlaps(
+      booked.get((column, entity_id), ()), show['start_time'], show['end_time']
+    )]
+    if clashes:
+      conflicts[index] = clashes
+      continue
+    for key in keys:
+      bisect.insort(booked.setdefault(key, []), (show['start_time'], show['end_time']))
+  return conflicts
+
+
+def _overlaps(intervals, start_time, end_time):
+  # intervals is sorted by start time. Bookings do not overlap each other,
+  # so only the last one starting before end_time can reach past start_time.
+  position = bisect.bisect_left(intervals, (end_time,))
+  return position > 0 and intervals[position - 1][1] > start_time
@@ -0,0 +1,148 @@
+import re
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from app import db
+
+# How far before the newest updated_at seen a refresh re-reads rows, so a
+# write that committed after a newer one is still picked up
+REFRESH_OVERLAP = timedelta(minutes=5)
+
+
+def tokenize(text):
+  return re.findall(r'\w+', (text or '').lower())
+
+
+def _substrings(word, size):
+  return {word[i:i + size] for i in range(len(word) - size + 1)}
+
+
+def _grams(token):
+  # A word can only contain the token if it holds all of these substrings
+  return _substrings(token, min(3, len(token)))
+
+
+class InvertedIndex:
+  # In-process n-gram index over search documents, used where the database
+  # offers no trigram index (SQLite in local and test runs). Callers hold
+  # `lock` around updates and searches.
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.seen = (0, None)
+    self.clear()
+
+  def clear(self):
+    self.names = {}
+    self.words = {}
+    self.postings = defaultdict(set)
+
+  def add(self, entity_id, document):
+    self.remove(entity_id)
+    document = document or ''
+    self.names[entity_id] = document.split('\n')[0]
+    self.words[entity_id] = set(tokenize(document))
+    for word in self.words[entity_id]:
+      for size in (1, 2, 3):
+        for gram in _substrings(word, size):
+          self.postings[gram].add(entity_id)
+
+  def remove(self, entity_id):
+    self.names.pop(entity_id, None)
+    for word in self.words.pop(entity_id, ()):
+      for size in (1, 2, 3):
+        for gram in _substrings(word, size):
+          self.postings[gram].discard(entity_id)
+
+  def search(self, tokens):
+    # Returns {entity_id: score} for the entities whose words contain every
+    # token. A token scores higher the more of its word it covers.
+    if not tokens:
+      return {entity_id: 0 for entity_id in self.words}
+
+    scores = None
+    for token in tokens:
+      candidates = set.intersection(*(self.postings.get(gram, set()) for gram in _grams(token)))
+      token_scores = {}
+      for entity_id in candidates:
+        covering = [word for word in self.words[entity_id] if token in word]
+        if covering:
+          token_scores[entity_id] = len(token) / min(len(word) for word in covering)
+      if scores is None:
+        scores = token_scores
+      else:
+        scores = {entity_id: score + token_scores[entity_id] for entity_id, score in scores.items() if entity_id in token_scores}
+      if not scores:
+        break
+    return scores
+
+
+_inverted_indexes = {}
+_inverted_indexes_lock = threading.Lock()
+
+
+def _inverted_index(model):
+  # The model's index, brought up to date from the committed rows first:
+  # one query when nothing changed, otherwise the rows updated since the
+  # last search, or everything again after a delete. Uncommitted or
+  # rolled-back writes never reach it, and every worker process converges
+  # on the same rows.
+  with _inverted_indexes_lock:
+    index = _inverted_indexes.setdefault(model, InvertedIndex())
+  count, updated_at = db.session.query(db.func.count(model.id), db.func.max(model.updated_at)).one()
+  with index.lock:
+    if (count, updated_at) != index.seen:
+      query = db.session.query(model.id, model.search_document)
+      if index.seen[1] is not None and count >= len(index.words):
+        for entity_id, document in query.filter(model.updated_at >= index.seen[1] - REFRESH_OVERLAP):
+          index.add(entity_id, document)
+      if len(index.words) != count or index.seen[1] is None:
+        index.clear()
+        for entity_id, document in query:
+          index.add(entity_id, document)
+      index.seen = (count, updated_at)
+  return index
+
+
+def trigram_query(model, tokens):
+  # Entities whose search document contains every token, best matches
+  # first. The LIKE conditions are answered from the pg_trgm GIN index.
+  matches = model.query.filter(*[
+    model.search_document.contains(token, autoescape=True) for token in tokens
+  ])
+  rank = db.func.word_similarity(' '.join(tokens), model.search_document)
+  return matches, matches.order_by(rank.desc(), model.name, model.id)
+
+
+def _search_trigram(model, tokens, offset, limit, max_results):
+  matches, ranked = trigram_query(model, tokens)
+  count = db.session.query(db.func.count()).select_from(
+    matches.with_entities(model.id).limit(max_results).subquery()
+  ).scalar()
+  return count, ranked.offset(offset).limit(limit).all()
+
+
+def _search_inverted(model, tokens, offset, limit, max_results):
+  index = _inverted_index(model)
+  with index.lock:
+    scores = index.search(tokens)
+    ranked = sorted(scores, key=lambda entity_id: (-scores[entity_id], index.names[entity_id], entity_id))[:max_results]
+  if not ranked:
+    return 0, []
+  page_ids = ranked[offset:offset + limit]
+  entities = {entity.id: entity for entity in model.query.filter(model.id.in_(page_ids))}
+  results = [entities[entity_id] for entity_id in page_ids if entity_id in entities]
+  return len(ranked), results
+
+
+def search(model, term, page=1, per_page=20, max_results=1000):
+  # Ranked search over name, city, state and genres. Every word of the term
+  # has to occur in the entity's search document. Returns the number of
+  # matches, capped at max_results, and the requested page of entities.
+  tokens = tokenize(term)
+  offset = (max(page, 1) - 1) * per_page
+  limit = max(min(per_page, max_results - offset), 0)
+  if db.engine.dialect.name == 'postgresql':
+    return _search_trigram(model, tokens, offset, limit, max_results)
+  return _search_inverted(model, tokens, offset, limit, max_results)
@@ -0,0 +1,234 @@
+"""Pre-forking production server.
+
+  python server.py
+
+Imports the app once in a master process, then forks SERVER_WORKERS
+workers (one per CPU core by default) that share the listening socket and
+the preloaded code and data copy-on-write. Each worker serves
+SERVER_THREADS requests at a time, so concurrent requests overlap their
+database waits both across and within workers. A worker exits after serving
+SERVER_MAX_REQUESTS requests and the master forks a fresh one, which caps
+memory growth.
+
+Signals to the master:
+  HUP        reload: re-executes the master on the current code, starts new
+             workers on the same socket, then retires the old ones once
+             they finish their requests. Skipped if the code fails to import.
+  TERM, INT  graceful shutdown within SERVER_GRACEFUL_TIMEOUT seconds.
+
+Settings come from config.py, most of them from the environment. POSIX only.
+"""
+import gc
+import itertools
+import logging
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+logger = logging.getLogger('server')
+
+# Set across a reload so the re-executed master adopts the listening socket
+# and retires the previous workers
+LISTEN_FD_ENV = 'FYYUR_SERVER_FD'
+RETIRING_ENV = 'FYYUR_SERVER_RETIRING'
+
+
+class PreforkServer:
+
+  def __init__(self, app):
+    config = app.config
+    self.app = app
+    self.host = config['SERVER_HOST']
+    self.port = config['SERVER_PORT']
+    self.worker_count = config['SERVER_WORKERS'] or os.cpu_count() or 1
+    self.threads = config['SERVER_THREADS']
+    self.max_requests = config['SERVER_MAX_REQUESTS']
+    self.max_requests_jitter = config['SERVER_MAX_REQUESTS_JITTER']
+    self.graceful_timeout = config['SERVER_GRACEFUL_TIMEOUT']
+    self.workers = set()
+    self.retiring = set()
+    self.reload_requested = False
+    self.stopping = False
+    self.socket = None
+
+  # Master
+
+  def _listen(self):
+    fd = os.environ.pop(LISTEN_FD_ENV, None)
+    if fd is not None:
+      self.socket = socket.socket(fileno=int(fd))
+    else:
+      self.socket = socket.create_server((self.host, self.port), backlog=2048)
+    # Workers poll the shared socket so they notice signals between requests
+    self.socket.setblocking(False)
+
+  def run(self):
+    self._listen()
+    host, port = self.socket.getsockname()[:2]
+    logger.info('Master %d listening on %s:%d with %d workers', os.getpid(), host, port, self.worker_count)
+
+    signal.signal(signal.SIGHUP, self._request_reload)
+    signal.signal(signal.SIGTERM, self._request_stop)
+    signal.signal(signal.SIGINT, self._request_stop)
+
+    assets = self.app.extensions.get('assets')
+    if assets is not None and self.app.config.get('ASSETS_BUILD_ON_START'):
+      assets.build()
+
+    # Workers inherit the compiled templates instead of each compiling them
+    for name in self.app.jinja_env.list_templates():
+      self.app.jinja_env.get_template(name)
+
+    # Objects loaded so far stay out of the collector, whose bookkeeping
+    # writes would otherwise copy their pages into every worker
+    gc.freeze()
+    for _ in range(self.worker_count):
+      self._spawn()
+
+    # Workers of the master this one replaced in a reload are ours to reap
+    self.retiring = {int(pid) for pid in os.environ.pop(RETIRING_ENV, '').split(',') if pid}
+    self._signal_all(self.retiring, signal.SIGTERM)
+
+    while not self.stopping:
+      self._reap()
+      if self.reload_requested:
+        self.reload_requested = False
+        self._reload()
+      time.sleep(0.5)
+    self._shutdown()
+
+  def _spawn(self):
+    pid = os.fork()
+    if pid:
+      self.workers.add(pid)
+      return
+    try:
+      self._serve()
+    except BaseException:
+      logger.exception('Worker %d failed', os.getpid())
+      os._exit(1)
+    os._exit(0)
+
+  def _reap(self):
+    while True:
+      try:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+      except ChildProcessError:
+        return
+      if not pid:
+        return
+      self.retiring.discard(pid)
+      if pid in self.workers:
+        self.workers.remove(pid)
+        if not self.stopping:
+          if os.waitstatus_to_exitcode(status):
+            logger.warning('Worker %d exited with status %d', pid, os.waitstatus_to_exitcode(status))
+            # Don't spin when workers fail straight away
+            time.sleep(1)
+          self._spawn()
+
+  def _reload(self):
+    check = subprocess.run([sys.executable, '-c', 'import app'], cwd=os.path.dirname(os.path.abspath(__file__)))
+    if check.returncode:
+      logger.error('Not reloading: the app failed to import')
+      return
+    logger.info('Reloading')
+    self.socket.set_inheritable(True)
+    os.environ[LISTEN_FD_ENV] = str(self.socket.fileno())
+    os.environ[RETIRING_ENV] = ','.join(str(pid) for pid in self.workers | self.retiring)
+    os.execv(sys.executable, [sys.executable] + sys.argv)
+
+  def _shutdown(self):
+    logger.info('Shutting down')
+    children = self.workers | self.retiring
+    self._signal_all(children, signal.SIGTERM)
+    deadline = time.monotonic() + self.graceful_timeout
+    while children and time.monotonic() < deadline:
+      try:
+        pid, _ = os.waitpid(-1, os.WNOHANG)
+      except ChildProcessError:
+        break
+      if pid:
+        children.discard(pid)
+      else:
+        time.sleep(0.1)
+    self._signal_all(children, signal.SIGKILL)
+
+  @staticmethod
+  def _signal_all(pids, signum):
+    for pid in pids:
+      try:
+        os.kill(pid, signum)
+      except ProcessLookupError:
+        pass
+
+  def _request_reload(self, signum, frame):
+    self.reload_requested = True
+
+  def _request_stop(self, signum, frame):
+    self.stopping = True
+
+  # Worker
+
+  def _serve(self):
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    # Ctrl-C reaches the whole process group; the master relays it as TERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, self._request_stop)
+    self.stopping = False
+
+    # Connections the master may have opened stay with the master
+    state = self.app.extensions.get('sqlalchemy')
+    if state is not None:
+      with self.app.app_context():
+        for bind in [None] + list(self.app.config.get('SQLALCHEMY_BINDS') or ()):
+          state.db.get_engine(self.app, bind).dispose(close=False)
+
+    limit = self.max_requests
+    if limit:
+      limit += random.randint(0, self.max_requests_jitter)
+    counter = itertools.count(1)
+    self.handled = 0
+
+    def counted(environ, start_response):
+      self.handled = next(counter)
+      return self.app(environ, start_response)
+
+    server = make_server(self.host, self.port, counted, fd=self.socket.fileno())
+    server.socket.setblocking(False)
+    server.multithread = self.threads > 1
+    server.timeout = 1
+
+    def accept():
+      # Each thread takes one connection at a time off the shared socket
+      while not self.stopping and not (limit and self.handled >= limit):
+        server.handle_request()
+
+    threads = [threading.Thread(target=accept, daemon=True) for _ in range(self.threads - 1)]
+    for thread in threads:
+      thread.start()
+    logger.info('Worker %d started', os.getpid())
+    accept()
+    for thread in threads:
+      thread.join()
+    server.server_close()
+    if not self.stopping:
+      logger.info('Worker %d recycled after %d requests', os.getpid(), self.handled)
+
+
+def main():
+  logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(process)d %(levelname)s %(message)s')
+  from app import app
+
+  PreforkServer(app).run()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,55 @@
+import os
+
+# Read by config.py when app is imported; each test points the app at its
+# own SQLite file below
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import pytest
+
+from app import app as flask_app, db, cache
+from benchmarks.seed import seed
+from cache import LRUBackend
+import matchmaking
+import search
+
+
+@pytest.fixture
+def app(tmp_path):
+  flask_app.config.update(
+    TESTING=True,
+    WTF_CSRF_ENABLED=False,
+    # Tests roll the show counters themselves
+    COUNTER_ROLL_INTERVAL=0,
+    SQLALCHEMY_DATABASE_URI='sqlite:///%s' % (tmp_path / 'fyyur.db')
+  )
+  # Nothing cached against an earlier test's database may be served
+  cache.backend = LRUBackend()
+  cache.hits.clear()
+  cache.misses.clear()
+  flask_app.jinja_env.fragment_cache = LRUBackend()
+  for index in matchmaking._indexes.values():
+    index.reset()
+  search._inverted_indexes.clear()
+
+  with flask_app.app_context():
+    db.create_all()
+    db.session.remove()
+  yield flask_app
+  with flask_app.app_context():
+    db.session.remove()
+    db.get_engine().dispose()
+
+
+@pytest.fixture
+def client(app):
+  return app.test_client()
+
+
+@pytest.fixture
+def catalog(app):
+  # seed() with the app context it needs, popped again before any request
+  def fill(**sizes):
+    with app.app_context():
+      seed(**sizes)
+      db.session.remove()
+  return fill
@@ -0,0 +1,48 @@
+import json
+from datetime import timedelta
+
+import api
+from app import db
+from models import Venue, Artist, Show
+
+
+def _lines(response):
+  assert response.mimetype == 'application/x-ndjson'
+  assert response.is_streamed
+  return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_collections_stream_every_row_across_batches(app, client, catalog, monkeypatch):
+  monkeypatch.setattr(api, 'STREAM_BATCH_SIZE', 4)
+  catalog(venues=10, artists=9, shows=30)
+
+  venues = _lines(client.get('/api/v1/venues'))
+  assert [venue['id'] for venue in venues] == list(range(1, 11))
+  assert isinstance(venues[0]['genres'], list)
+  assert len(_lines(client.get('/api/v1/artists'))) == 9
+
+  shows = _lines(client.get('/api/v1/shows'))
+  assert len(shows) == 30
+  assert [show['start_time'] for show in shows] == sorted(show['start_time'] for show in shows)
+
+  with app.app_context():
+    jazz = {venue.id for venue in Venue.query if 'Jazz' in venue.genres}
+    first = db.session.query(db.func.min(Show.start_time)).scalar()
+    db.session.remove()
+  assert {venue['id'] for venue in _lines(client.get('/api/v1/venues?genre=Jazz'))} == jazz
+  assert _lines(client.get('/api/v1/shows', query_string={"to": (first + timedelta(seconds=1)).isoformat()})) == shows[:1]
+
+
+def test_detail_answers_json_and_404(app, client):
+  with app.app_context():
+    db.session.add(Artist(id=1, name='Guns N Petals', genres=['Rock n Roll']))
+    db.session.commit()
+    db.session.remove()
+
+  detail = client.get('/api/v1/artists/1').get_json()
+  assert (detail['name'], detail['genres']) == ('Guns N Petals', ['Rock n Roll'])
+  assert detail['upcoming_shows'] == detail['past_shows'] == []
+
+  missing = client.get('/api/v1/artists/2')
+  assert missing.status_code == 404
+  assert missing.get_json() == {"error": "not found"}
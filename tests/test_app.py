@@ -0,0 +1,23 @@
+from datetime import datetime
+
+import babel.dates
+import pytest
+
+from app import app as flask_app, format_datetime, DATETIME_FORMATS
+
+
+@pytest.mark.parametrize('format', ['full', 'medium', 'yyyy-MM-dd HH:mm'])
+def test_datetime_filter_formats_like_babel(format):
+  value = datetime(2099, 5, 21, 21, 30, 15)
+  expected = babel.dates.format_datetime(value, DATETIME_FORMATS.get(format, format), locale='en')
+
+  assert format_datetime(value, format) == expected
+  # Strings, as stored before start times were datetimes, still parse
+  assert format_datetime('2099-05-21T21:30:15.000Z', format) == expected
+  assert format_datetime('2099-05-21 21:30:15', format) == expected
+
+
+def test_datetime_filter_is_registered_with_jinja():
+  template = flask_app.jinja_env.from_string("{{ value|datetime('full') }}")
+  value = datetime(2099, 5, 21, 21, 30)
+  assert template.render(value=value) == format_datetime(value, 'full')
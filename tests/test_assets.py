@@ -0,0 +1,84 @@
+import gzip
+import hashlib
+import os
+
+import pytest
+from flask import Flask, render_template_string, url_for
+
+import assets
+from assets import Assets, BUNDLES, FILES
+
+
+@pytest.fixture
+def site(tmp_path):
+  # An app over a throwaway static folder holding every source the bundles
+  # and fingerprinted files name
+  static = tmp_path / 'static'
+  for source in sum(BUNDLES.values(), []) + FILES:
+    path = static / source
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text('/* %s */\n' % source + ('body { color : red ; }\n' * 20 if source.endswith('.css') else
+      'var x = 1; // %s\n' % source * 20))
+  (static / 'css' / 'main.css').write_text('.splash { background: url(../img/front-splash.jpg?v=1) }\n')
+  (static / 'img' / 'front-splash.jpg').write_bytes(b'\xff\xd8 not really a jpeg')
+  app = Flask(__name__, static_folder=str(static))
+  Assets(app)
+  return app
+
+
+def _fingerprinted(name, content):
+  stem, extension = os.path.splitext(name)
+  return '%s.%s%s' % (stem, hashlib.sha256(content).hexdigest()[:12], extension)
+
+
+def test_urls_name_the_sources_until_a_build_exists(site):
+  with site.test_request_context():
+    assert render_template_string("{{ asset_urls('head.js')|join(' ') }}") == ' '.join(
+      '/static/' + source for source in BUNDLES['head.js'])
+    assert url_for('static', filename='img/front-splash.jpg') == '/static/img/front-splash.jpg'
+
+
+def test_build_fingerprints_bundles_and_files_by_content(site):
+  manifest = site.extensions['assets'].build()
+  dist = os.path.join(site.static_folder, assets.DIST)
+
+  splash = manifest['files']['img/front-splash.jpg']
+  assert splash == _fingerprinted('front-splash.jpg', b'\xff\xd8 not really a jpeg')
+  for bundle, built in manifest['bundles'].items():
+    with open(os.path.join(dist, built), 'rb') as f:
+      assert built == _fingerprinted(bundle, f.read())
+  with open(os.path.join(dist, manifest['bundles']['main.css'])) as f:
+    css = f.read()
+  assert 'url("/static/dist/%s?v=1")' % splash in css
+  assert 'body{color : red}body{' in css and '/*' not in css
+
+  with site.test_request_context():
+    assert url_for('static', filename='img/front-splash.jpg') == '/static/dist/' + splash
+    assert site.jinja_env.globals['asset_urls']('main.css') == ['/static/dist/' + manifest['bundles']['main.css']]
+
+  # A changed source gets a new name; the previous build stays servable
+  with open(os.path.join(site.static_folder, 'js', 'plugins.js'), 'a') as f:
+    f.write('var y = 2;\n')
+  rebuilt = site.extensions['assets'].build()
+  assert rebuilt['bundles']['main.js'] != manifest['bundles']['main.js']
+  assert rebuilt['bundles']['main.css'] == manifest['bundles']['main.css']
+  assert os.path.exists(os.path.join(dist, manifest['bundles']['main.js']))
+
+
+def test_built_assets_are_sent_immutable_and_precompressed(site):
+  built = site.extensions['assets'].build()['bundles']['main.css']
+  client = site.test_client()
+
+  plain = client.get('/static/dist/' + built)
+  compressed = client.get('/static/dist/' + built, headers={'Accept-Encoding': 'gzip'})
+  for response in (plain, compressed):
+    assert response.status_code == 200
+    assert response.mimetype == 'text/css'
+    assert response.cache_control.immutable
+    assert response.cache_control.max_age == 365 * 24 * 3600
+    assert 'Accept-Encoding' in response.vary
+  assert plain.content_encoding is None
+  assert compressed.content_encoding == 'gzip'
+  assert gzip.decompress(compressed.data) == plain.data
+  plain.close()
+  compressed.close()
@@ -0,0 +1,200 @@
+import time
+
+import pytest
+
+from app import cache
+from cache import RedisBackend
+
+
+class FakeRedis:
+  # The mget/set/incr subset of redis-py that RedisBackend uses, on a dict.
+  # Values come back as bytes, as from a real server.
+
+  def __init__(self):
+    self.data = {}
+    self.incremented = []
+
+  def _get(self, key):
+    value, expires = self.data.get(key, (None, None))
+    if expires is not None and expires <= time.monotonic():
+      del self.data[key]
+      return None
+    return value
+
+  def mget(self, keys):
+    return [self._get(key) for key in keys]
+
+  def set(self, key, value, ex=None):
+    self.data[key] = (str(value).encode('utf-8'), None if ex is None else time.monotonic() + ex)
+    return True
+
+  def incr(self, key):
+    value = int(self._get(key) or 0) + 1
+    self.data[key] = (str(value).encode('utf-8'), None)
+    self.incremented.append(key)
+    return value
+
+
+@pytest.fixture
+def redis(app):
+  client = FakeRedis()
+  cache.backend = RedisBackend(client)
+  return client
+
+
+def _form(name, **fields):
+  form = {
+    "name": name,
+    "city": 'City 0',
+    "state": 'CA',
+    "phone": '555-000-0000',
+    "genres": 'Jazz',
+    "image_link": '',
+    "facebook_link": '',
+    "website_link": '',
+    "seeking_description": ''
+  }
+  form.update(fields)
+  return form
+
+
+def test_redis_backend_round_trip(redis):
+  backend = cache.backend
+  backend.set('page', '<html>', 60)
+  backend.set('short', 'gone', -1)
+
+  assert backend.get_many(['page', 'short', 'missing']) == ['<html>', None, None]
+  assert backend.incr('v:venues') == 1
+  assert backend.incr('v:venues') == 2
+  assert backend.get_many(['v:venues']) == ['2']
+  assert set(redis.data) == {'fyyur:page', 'fyyur:v:venues'}
+
+
+def test_page_keys_carry_endpoint_and_argument_versions(client, catalog, redis):
+  catalog(venues=2, artists=2, shows=10)
+
+  first = client.get('/venues/1')
+  assert client.get('/venues/1').data == first.data
+  assert cache.stats()['show_venue'] == {"hits": 1, "misses": 1}
+
+  cache.invalidate('show_venue', venue_id=2)
+  client.get('/venues/1')
+  assert cache.stats()['show_venue'] == {"hits": 2, "misses": 1}
+
+  cache.invalidate('show_venue', venue_id=1)
+  client.get('/venues/1')
+  cache.invalidate('show_venue')
+  client.get('/venues/1')
+  assert cache.stats()['show_venue'] == {"hits": 2, "misses": 3}
+
+
+def _scopes(redis):
+  return {key[len('fyyur:v:'):] for key in redis.incremented}
+
+
+def test_create_venue_invalidates_venue_listings(client, catalog, redis):
+  catalog(venues=2, artists=2, shows=0)
+  redis.incremented.clear()
+  client.post('/venues/create', data=_form('New venue', address='1 Main St'))
+  assert _scopes(redis) == {'venues', 'venues_near'}
+
+
+def test_create_artist_invalidates_artist_listing(client, catalog, redis):
+  catalog(venues=2, artists=2, shows=0)
+  redis.incremented.clear()
+  client.post('/artists/create', data=_form('New artist'))
+  assert _scopes(redis) == {'artists'}
+
+
+def test_create_show_invalidates_its_venue_and_artist(client, catalog, redis):
+  catalog(venues=2, artists=2, shows=0)
+  client.get('/venues/1')
+  client.get('/venues/2')
+  redis.incremented.clear()
+
+  client.post('/shows/create', data={
+    "venue_id": '1', "artist_id": '2', "start_time": '2099-01-01 20:00:00', "duration": '90'
+  })
+
+  assert _scopes(redis) == {
+    'shows', 'venues', 'venues_near',
+    'show_venue(venue_id=1)', 'venue_calendar(venue_id=1)',
+    'show_artist(artist_id=2)', 'artist_calendar(artist_id=2)'
+  }
+  assert b'2099' in client.get('/venues/1').data
+  client.get('/venues/2')
+  assert cache.stats()['show_venue'] == {"hits": 1, "misses": 3}
+
+
+def _book(client, venue_id, artist_id, start_time):
+  client.post('/shows/create', data={
+    "venue_id": str(venue_id), "artist_id": str(artist_id), "start_time": start_time
+  })
+
+
+def test_edit_venue_invalidates_the_pages_showing_it(client, catalog, redis):
+  catalog(venues=2, artists=3, shows=0)
+  _book(client, 1, 1, '2099-01-01 20:00:00')
+  _book(client, 1, 2, '2099-01-02 20:00:00')
+  _book(client, 2, 3, '2099-01-03 20:00:00')
+  redis.incremented.clear()
+
+  client.post('/venues/1/edit', data=_form('Renamed venue', address='1 Main St'))
+
+  assert _scopes(redis) == {
+    'venues', 'venues_near', 'shows',
+    'show_venue(venue_id=1)', 'venue_calendar(venue_id=1)',
+    'show_artist(artist_id=1)', 'artist_calendar(artist_id=1)',
+    'show_artist(artist_id=2)', 'artist_calendar(artist_id=2)'
+  }
+  assert b'Renamed venue' in client.get('/artists/2').data
+
+
+def test_delete_venue_invalidates_the_pages_showing_it(client, catalog, redis):
+  catalog(venues=2, artists=3, shows=0)
+  _book(client, 1, 1, '2099-01-01 20:00:00')
+  _book(client, 2, 3, '2099-01-03 20:00:00')
+  redis.incremented.clear()
+
+  client.delete('/venues/1')
+
+  assert _scopes(redis) == {
+    'venues', 'venues_near', 'shows',
+    'show_venue(venue_id=1)', 'venue_calendar(venue_id=1)',
+    'show_artist(artist_id=1)', 'artist_calendar(artist_id=1)'
+  }
+  assert client.get('/venues/1').status_code == 404
+
+
+def test_fragment_tag_renders_once_per_key(app):
+  calls = []
+  template = app.jinja_env.from_string("{% cache 'tile', id, version %}{{ render(id) }}{% endcache %}")
+
+  def render(value):
+    calls.append(value)
+    return 'tile %s v%d' % (value, len(calls))
+
+  assert template.render(id=1, version='a', render=render) == 'tile 1 v1'
+  assert template.render(id=1, version='a', render=render) == 'tile 1 v1'
+  assert template.render(id=2, version='a', render=render) == 'tile 2 v2'
+  assert template.render(id=1, version='b', render=render) == 'tile 1 v3'
+  assert calls == [1, 2, 1]
+
+
+def test_show_tiles_follow_renamed_venues(client, catalog):
+  catalog(venues=1, artists=1, shows=0)
+  _book(client, 1, 1, '2099-01-01 20:00:00')
+  assert b'Venue 1<' in client.get('/shows').data
+
+  client.post('/venues/1/edit', data=_form('Renamed venue', address='1 Main St'))
+  listing = client.get('/shows').data
+  assert b'Renamed venue<' in listing and b'Venue 1<' not in listing
+
+
+def test_compiled_templates_are_kept_on_disk(app, client):
+  directory = app.jinja_env.bytecode_cache.directory
+  assert directory == app.config['TEMPLATE_BYTECODE_CACHE_DIR']
+  client.get('/')
+  source, filename, _ = app.jinja_loader.get_source(app.jinja_env, 'pages/home.html')
+  bucket = app.jinja_env.bytecode_cache.get_bucket(app.jinja_env, 'pages/home.html', filename, source)
+  assert bucket.code is not None
@@ -0,0 +1,113 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import counters
+
+
+def _write_elsewhere(app, statement, *params):
+  # A write the serving process gets no invalidation for, as from another
+  # worker or a CLI command
+  connection = sqlite3.connect(app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):])
+  with connection:
+    connection.execute(statement, params)
+  connection.close()
+
+
+def test_etag_revalidation_answers_304(client, catalog):
+  catalog(venues=3, artists=3, shows=10)
+  response = client.get('/venues/1')
+  etag = response.headers['ETag']
+
+  again = client.get('/venues/1', headers={'If-None-Match': etag})
+  assert again.status_code == 304
+  assert again.headers['ETag'] == etag
+
+
+def test_write_from_another_process_is_not_served_from_cache(app, client, catalog):
+  catalog(venues=3, artists=3, shows=10)
+  response = client.get('/venues/1')
+  etag = response.headers['ETag']
+
+  later = (datetime.utcnow() + timedelta(seconds=1)).isoformat(' ')
+  _write_elsewhere(app, 'UPDATE venue SET name = ?, updated_at = ? WHERE id = 1', 'Renamed venue', later)
+
+  changed = client.get('/venues/1', headers={'If-None-Match': etag})
+  assert changed.status_code == 200
+  assert changed.headers['ETag'] != etag
+  assert b'Renamed venue' in changed.data
+
+
+def test_listing_changes_after_delete_without_if_none_match(app, client, catalog):
+  catalog(venues=3, artists=3, shows=0)
+  response = client.get('/venues')
+  assert response.last_modified is None
+
+  _write_elsewhere(app, 'DELETE FROM venue WHERE id = 3')
+
+  since = datetime.utcnow() + timedelta(days=1)
+  changed = client.get('/venues', headers={'If-Modified-Since': since.strftime('%a, %d %b %Y %H:%M:%S GMT')})
+  assert changed.status_code == 200
+  assert b'/venues/3"' not in changed.data
+
+
+def test_pages_leave_the_session_of_cookieless_visitors_alone(app, client, catalog, monkeypatch):
+  # Flask sends Vary: Cookie with every response whose session was read
+  accessed = []
+  save_session = app.session_interface.save_session
+
+  def recording_save_session(app, session, response):
+    accessed.append(session.accessed)
+    return save_session(app, session, response)
+
+  monkeypatch.setattr(app.session_interface, 'save_session', recording_save_session)
+  catalog(venues=3, artists=3, shows=10)
+  for path in ('/venues', '/venues/1', '/artists/1', '/shows'):
+    response = client.get(path)
+    assert response.status_code == 200
+    assert 'ETag' in response.headers
+  assert accessed == [False] * 4
+
+  with client.session_transaction() as session:
+    session['_flashes'] = [('message', 'Venue 1 was successfully listed!')]
+  flashed = client.get('/venues/1')
+  assert b'Venue 1 was successfully listed!' in flashed.data
+  assert 'ETag' not in flashed.headers
+
+
+def test_calendar_redirect_is_not_revalidated(client, catalog):
+  catalog(venues=1, artists=1, shows=0)
+  for path in ('/venues/1/calendar', '/artists/1/calendar'):
+    response = client.get(path)
+    assert response.status_code == 302
+    assert 'ETag' not in response.headers
+
+    again = client.get(path, headers={'If-None-Match': '*'})
+    assert again.status_code == 302
+    assert again.location == response.location
+
+
+def test_etags_follow_the_data_each_page_shows(app, client, catalog):
+  catalog(venues=2, artists=2, shows=0)
+  paths = ('/venues', '/venues/1', '/artists', '/artists/1', '/shows')
+
+  def etags():
+    return {path: client.get(path).headers['ETag'] for path in paths}
+
+  before = etags()
+  assert etags() == before
+
+  client.post('/shows/create', data={"venue_id": '1', "artist_id": '1', "start_time": '2099-01-01 20:00:00'})
+  booked = etags()
+  assert all(booked[path] != before[path] for path in paths)
+
+  later = (datetime.utcnow() + timedelta(seconds=1)).isoformat(' ')
+  _write_elsewhere(app, 'UPDATE venue SET name = ?, updated_at = ? WHERE id = 1', 'Renamed venue', later)
+  renamed = etags()
+  assert {path for path in paths if renamed[path] != booked[path]} == {'/venues', '/venues/1', '/shows'}
+
+  with app.app_context():
+    counters.roll(datetime(2099, 1, 2))
+  rolled = etags()
+  # The roll moves the show's counts, which every page but /shows lists,
+  # and touches the venue and artist doing so
+  assert all(rolled[path] != renamed[path] for path in paths)
@@ -0,0 +1,46 @@
+import pytest
+from sqlalchemy import create_engine, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+
+from app import db
+from database import InstrumentedQueuePool
+
+
+def test_pool_counts_checkouts_waits_and_timeouts(tmp_path):
+  engine = create_engine('sqlite:///%s' % (tmp_path / 'pool.db'), poolclass=InstrumentedQueuePool,
+    pool_size=1, max_overflow=0, pool_timeout=0.05)
+  held = engine.connect()
+  with pytest.raises(exc.TimeoutError):
+    engine.connect()
+  held.close()
+  with engine.connect():
+    pass
+
+  stats = engine.pool.stats()
+  assert (stats['size'], stats['checked_out'], stats['checkouts']) == (1, 0, 3)
+  assert (stats['waits'], stats['timeouts']) == (1, 1)
+  assert stats['wait_ms_max'] >= 50
+  engine.dispose()
+
+
+def test_pool_options_apply_to_every_database_but_sqlite(app):
+  app.config['SQLALCHEMY_POOL_OPTIONS'] = dict(app.config['SQLALCHEMY_POOL_OPTIONS'], pool_size=7)
+  try:
+    _, options = db.apply_driver_hacks(app, make_url('postgresql://fyyur@db/fyyur'), {})
+    assert options['poolclass'] is InstrumentedQueuePool
+    assert options['pool_size'] == 7
+
+    # SQLite keeps the NullPool Flask-SQLAlchemy gives file databases
+    _, options = db.apply_driver_hacks(app, make_url(app.config['SQLALCHEMY_DATABASE_URI']), {})
+    assert options['poolclass'] is NullPool
+    assert 'pool_size' not in options
+  finally:
+    app.config['SQLALCHEMY_POOL_OPTIONS'] = dict(app.config['SQLALCHEMY_POOL_OPTIONS'], pool_size=5)
+
+
+def test_pool_metrics_report_the_primary(client):
+  assert client.get('/').status_code == 200
+  metrics = client.get('/metrics/pool').get_json()
+  assert list(metrics) == ['primary']
+  assert 'pool' in metrics['primary']
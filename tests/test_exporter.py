@@ -0,0 +1,67 @@
+import csv
+import gzip
+import io
+import sys
+
+import pytest
+
+from app import db
+from models import Venue
+import exporter
+
+
+def _venues(app):
+  with app.app_context():
+    venues = sorted((venue.id, venue.name, venue.city, venue.state, tuple(venue.genres), venue.seeking_talent)
+      for venue in Venue.query)
+    db.session.remove()
+  return venues
+
+
+def test_csv_export_downloads_gzipped_and_loads_back(app, client, monkeypatch):
+  monkeypatch.setattr(exporter, 'EXPORT_BATCH_SIZE', 3)
+  with app.app_context():
+    db.session.add_all([
+      Venue(id=i, name='Venue "%d", Hall' % i, city='San Francisco', state='CA', address='%d Main St' % i,
+        genres=['Jazz', 'R&B'][:i % 2 + 1], facebook_link='https://www.facebook.com/venue%d' % i,
+        seeking_talent=i % 3 == 0)
+      for i in range(1, 11)
+    ])
+    db.session.commit()
+    db.session.remove()
+  exported = _venues(app)
+
+  response = client.get('/api/v1/export/venues')
+  assert response.mimetype == 'application/gzip'
+  assert response.headers['Content-Disposition'] == 'attachment; filename=venues.csv.gz'
+  text = gzip.decompress(response.data).decode('utf-8')
+  assert len(list(csv.DictReader(io.StringIO(text)))) == 10
+
+  with app.app_context():
+    Venue.query.delete()
+    db.session.commit()
+    db.session.remove()
+  upload = client.post('/api/v1/import/venues', data={"file": (io.BytesIO(text.encode('utf-8')), 'venues.csv')})
+  assert upload.get_json()['rejected'] == 0
+  assert [venue[1:] for venue in _venues(app)] == [venue[1:] for venue in exported]
+
+
+def test_parquet_export_holds_every_row(app, catalog):
+  parquet = pytest.importorskip('pyarrow.parquet')
+  catalog(venues=7, artists=3, shows=12)
+
+  with app.app_context():
+    data = b''.join(exporter.export_rows('shows', 'parquet', batch_size=5))
+    db.session.remove()
+  table = parquet.read_table(io.BytesIO(data))
+  assert table.num_rows == 12
+  assert parquet.ParquetFile(io.BytesIO(data)).num_row_groups == 3
+  starts = table.column('start_time').to_pylist()
+  assert starts == sorted(starts)
+
+
+def test_parquet_export_without_pyarrow_is_501(client, monkeypatch):
+  monkeypatch.setitem(sys.modules, 'pyarrow', None)
+  response = client.get('/api/v1/export/venues?format=parquet')
+  assert response.status_code == 501
+  assert 'parquet' in response.get_json()['error']
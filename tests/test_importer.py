@@ -0,0 +1,70 @@
+import io
+
+from app import db
+from models import Venue, Artist, Show
+
+VENUES_CSV = (
+  'name,city,state,address,genres,facebook_link\n'
+  'The Musical Hop,San Francisco,CA,1015 Folsom Street,"Jazz,Reggae",https://www.facebook.com/TheMusicalHop\n'
+  'Nameless,San Francisco,CA,1 Main Street,Jazz,https://www.facebook.com/Nameless\n'
+  'Park Square,New York,NY,34 Whiskey Moore Ave,Folk,not a link\n'
+)
+
+
+def _import(client, kind, body, **args):
+  query = '&'.join('%s=%s' % item for item in args.items())
+  return client.post('/api/v1/import/%s?%s' % (kind, query), data=body, content_type='text/csv')
+
+
+def test_import_inserts_valid_rows_and_reports_the_rest(app, client):
+  response = _import(client, 'venues', VENUES_CSV.replace('Nameless', ''))
+  assert response.status_code == 200
+  report = response.get_json()
+  assert (report['inserted'], report['rejected']) == (1, 2)
+  assert report['errors'] == [
+    {"line": 3, "errors": {"name": ['This field is required.']}},
+    {"line": 4, "errors": {"facebook_link": ['Invalid URL.']}}
+  ]
+
+  with app.app_context():
+    assert [(venue.name, venue.genres) for venue in Venue.query] == [('The Musical Hop', ['Jazz', 'Reggae'])]
+    db.session.remove()
+
+
+def test_import_rejects_unknown_references_and_clashes_within_a_batch(app, client):
+  with app.app_context():
+    db.session.add_all([Venue(id=1, name='Venue'), Artist(id=1, name='Artist'), Artist(id=2, name='Other')])
+    db.session.commit()
+    db.session.remove()
+
+  response = _import(client, 'shows', (
+    'venue_id,artist_id,start_time\n'
+    '1,1,2099-01-01 20:00:00\n'
+    '1,3,2099-01-02 20:00:00\n'
+    '1,2,2099-01-01 21:00:00\n'
+    '1,2,2099-01-03 20:00:00\n'
+  ), batch_size=10)
+  report = response.get_json()
+  assert (report['inserted'], report['rejected']) == (2, 2)
+  assert [error['line'] for error in report['errors']] == [3, 4]
+  assert report['errors'][0]['errors'] == {"artist_id": ['No artist with id 3']}
+  assert list(report['errors'][1]['errors']) == ['venue_id']
+
+  with app.app_context():
+    assert sorted(db.session.query(Show.artist_id, Show.start_time.like('2099-01-03%'))) == [(1, False), (2, True)]
+    db.session.remove()
+
+
+def test_import_bounds_batch_size_and_body_length(app, client):
+  for batch_size in ('0', '50001', 'ten', '-1'):
+    response = _import(client, 'venues', VENUES_CSV, batch_size=batch_size)
+    assert response.status_code == 400
+  assert _import(client, 'venues', VENUES_CSV, batch_size=50000).status_code == 200
+
+  app.config['MAX_CONTENT_LENGTH'] = len(VENUES_CSV) - 1
+  try:
+    assert _import(client, 'venues', VENUES_CSV).status_code == 413
+    upload = client.post('/api/v1/import/venues', data={"file": (io.BytesIO(VENUES_CSV.encode()), 'venues.csv')})
+    assert upload.status_code == 413
+  finally:
+    app.config['MAX_CONTENT_LENGTH'] = 64 * 1024 * 1024
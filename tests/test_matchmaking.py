@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from models import Venue, Artist, Show
+import matchmaking
+
+
+@pytest.fixture
+def catalog(app):
+  with app.app_context():
+    db.session.add_all([
+      Venue(id=1, name='Home', city='San Francisco', state='CA', genres=['Jazz', 'Rock'], seeking_talent=True),
+      Artist(id=1, name='Local', city='San Francisco', state='CA', genres=['Jazz', 'Rock'], seeking_venue=True),
+      Artist(id=2, name='Far', city='New York', state='NY', genres=['Jazz'], seeking_venue=True),
+      Artist(id=3, name='Busy', city='San Francisco', state='CA', genres=['Jazz'], seeking_venue=False),
+      Artist(id=4, name='Other genre', city='San Francisco', state='CA', genres=['Pop'], seeking_venue=True),
+      Artist(id=5, name='In state', city='Oakland', state='CA', genres=['Rock'], seeking_venue=True),
+    ])
+    db.session.commit()
+    db.session.add(Show(venue_id=1, artist_id=2, start_time=datetime.now() - timedelta(days=10)))
+    db.session.commit()
+    db.session.remove()
+
+
+def _ranked(client, path):
+  return [(match.get('artist_id') or match.get('venue_id'), match['score']) for match in client.get(path).get_json()]
+
+
+def test_recommended_artists_rank_by_genre_location_and_history(client, catalog):
+  ranked = _ranked(client, '/api/v1/venues/1/recommended-artists')
+  assert [artist_id for artist_id, _ in ranked] == [1, 5, 2]
+  assert ranked[0][1] == pytest.approx(0.9)
+  # Jaccard 0.5, over the location floor of the same state
+  assert ranked[1][1] >= 0.6 * 0.5 + 0.3 * 0.5
+  # Jaccard 0.5, 4000 km away, one past show together
+  assert ranked[2][1] == pytest.approx(0.6 * 0.5 + 0.1 / 3, abs=1e-4)
+
+
+def test_recommended_venues_for_an_artist(client, catalog):
+  assert [venue_id for venue_id, _ in _ranked(client, '/api/v1/artists/1/recommended-venues')] == [1]
+  assert client.get('/api/v1/artists/4/recommended-venues').get_json() == []
+  assert client.get('/api/v1/artists/99/recommended-venues').status_code == 404
+
+
+def test_limit_is_clamped(client, catalog):
+  for limit, expected in (('-1', 1), ('0', 1), ('2', 2), ('1000', 3)):
+    assert len(client.get('/api/v1/venues/1/recommended-artists?limit=' + limit).get_json()) == expected
+
+
+def test_index_picks_up_changes_and_new_genres(app, client, catalog):
+  client.get('/api/v1/venues/1/recommended-artists')
+
+  with app.app_context():
+    # More genres than fit a 64-bit word
+    invented = ['Genre %d' % i for i in range(80)]
+    Artist.query.get(2).genres = ['Rock', 'Jazz']
+    db.session.add(Artist(id=6, name='Eclectic', city='San Francisco', state='CA', genres=invented + ['Jazz'],
+      seeking_venue=True))
+    Venue.query.get(1).genres = ['Jazz', 'Rock', invented[-1]]
+    db.session.commit()
+    db.session.remove()
+
+  ranked = dict(_ranked(client, '/api/v1/venues/1/recommended-artists'))
+  assert set(ranked) == {1, 2, 5, 6}
+  assert ranked[2] == pytest.approx(0.6 * 2 / 3 + 0.1 / 3, abs=1e-4)
+  assert ranked[6] == pytest.approx(0.6 * 2 / 82 + 0.3, abs=1e-4)
+  assert matchmaking._indexes[Artist].table.masks.shape[1] == 2
+
+  with app.app_context():
+    db.session.delete(Artist.query.get(6))
+    db.session.commit()
+    db.session.remove()
+  assert 6 not in dict(_ranked(client, '/api/v1/venues/1/recommended-artists'))
@@ -0,0 +1,45 @@
+import pytest
+
+from app import profiler
+from profiler import QueryBudgetExceeded
+
+
+def _queries(endpoint):
+  return profiler.stats().get(endpoint, {}).get('queries', 0)
+
+
+def test_request_queries_in_headers_and_totals(client, catalog):
+  catalog(venues=5, artists=5, shows=20)
+  before = _queries('show_venue')
+
+  response = client.get('/venues/1')
+
+  assert response.headers['X-Query-Count'] == '2'
+  assert 'db;dur=' in response.headers['Server-Timing']
+  assert _queries('show_venue') == before + 2
+
+
+@pytest.mark.parametrize('path, endpoint', [
+  ('/api/v1/venues', 'api.venues'),
+  ('/api/v1/shows', 'api.shows'),
+  ('/api/v1/export/artists', 'api.export'),
+])
+def test_streamed_response_queries_count_once_sent(client, catalog, path, endpoint):
+  catalog(venues=5, artists=5, shows=20)
+  before = _queries(endpoint)
+
+  with profiler.max_queries(10) as stats:
+    response = client.get(path, buffered=True)
+
+  assert response.status_code == 200
+  assert 'X-Query-Count' not in response.headers
+  assert stats.count >= 1
+  assert _queries(endpoint) == before + stats.count
+
+
+def test_streamed_response_over_budget_fails_under_test(client, catalog, monkeypatch):
+  catalog(venues=5, artists=5, shows=20)
+  monkeypatch.setattr(profiler, 'budget', 0)
+
+  with pytest.raises(QueryBudgetExceeded):
+    client.get('/api/v1/venues', buffered=True)
@@ -0,0 +1,81 @@
+import sqlite3
+
+from sqlalchemy.dialects import postgresql
+
+from app import db
+from models import Venue, Artist
+from search import search, trigram_query
+
+
+def _venue(venue_id, name, city='San Francisco', state='CA', genres=('Jazz',)):
+  return Venue(id=venue_id, name=name, city=city, state=state, genres=list(genres), address='1 Main St')
+
+
+def _names(model, term):
+  count, results = search(model, term)
+  assert count == len(results)
+  return [entity.name for entity in results]
+
+
+def test_inverted_index_matches_every_word_best_first(app):
+  with app.app_context():
+    db.session.add_all([
+      _venue(1, 'The Musical Hop'),
+      _venue(2, 'Park Square Live Music & Coffee', city='New York', state='NY', genres=('Rock',)),
+      _venue(3, 'The Dueling Pianos Bar', city='New York', state='NY'),
+    ])
+    db.session.commit()
+
+    assert sorted(_names(Venue, 'music')) == ['Park Square Live Music & Coffee', 'The Musical Hop']
+    assert _names(Venue, 'hop') == ['The Musical Hop']
+    assert _names(Venue, 'new york jazz') == ['The Dueling Pianos Bar']
+    assert _names(Venue, 'music jazz') == ['The Musical Hop']
+    assert _names(Venue, 'nothing') == []
+    db.session.remove()
+
+
+def test_inverted_index_follows_commits_only(app):
+  with app.app_context():
+    db.session.add(_venue(1, 'The Musical Hop'))
+    db.session.commit()
+    assert _names(Venue, 'hop') == ['The Musical Hop']
+
+    db.session.add(_venue(2, 'Hop Along'))
+    db.session.flush()
+    db.session.rollback()
+    assert _names(Venue, 'hop') == ['The Musical Hop']
+
+    Venue.query.get(1).name = 'The Jazz Cellar'
+    db.session.commit()
+    assert _names(Venue, 'hop') == []
+    assert _names(Venue, 'cellar') == ['The Jazz Cellar']
+
+    db.session.delete(Venue.query.get(1))
+    db.session.commit()
+    assert _names(Venue, 'cellar') == []
+    db.session.remove()
+
+
+def test_inverted_index_picks_up_writes_from_other_processes(app):
+  with app.app_context():
+    db.session.add(Artist(id=1, name='Guns N Petals', city='San Francisco', state='CA', genres=['Rock']))
+    db.session.commit()
+    assert _names(Artist, 'petals') == ['Guns N Petals']
+
+    connection = sqlite3.connect(app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):])
+    with connection:
+      connection.execute("INSERT INTO artist (id, name, search_document, updated_at) "
+        "VALUES (2, 'Matt Quevedo', 'matt quevedo\nnew york, ny\njazz', '2999-01-01 00:00:00')")
+    connection.close()
+    assert _names(Artist, 'quevedo') == ['Matt Quevedo']
+    db.session.remove()
+
+
+def test_trigram_query_for_postgres(app):
+  with app.app_context():
+    matches, ranked = trigram_query(Venue, ['mus', '50%'])
+    sql = str(ranked.statement.compile(dialect=postgresql.dialect()))
+
+  assert sql.count('venue.search_document LIKE') == 2
+  assert "ESCAPE '/'" in sql
+  assert sql.endswith('ORDER BY word_similarity(%(word_similarity_1)s, venue.search_document) DESC, venue.name, venue.id')
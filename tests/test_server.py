@@ -0,0 +1,140 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import pytest
+
+from server import PreforkServer
+
+SLOW_SECONDS = 0.5
+
+
+def _start(app, **config):
+  app.config.update(SERVER_HOST='127.0.0.1', SERVER_PORT=0, SERVER_WORKERS=1, SERVER_MAX_REQUESTS=0)
+  app.config.update(config)
+  server = PreforkServer(app)
+  server._listen()
+  server._spawn()
+  return server, 'http://127.0.0.1:%d' % server.socket.getsockname()[1]
+
+
+def _stop(server):
+  server._signal_all(server.workers, signal.SIGTERM)
+  for pid in server.workers:
+    os.waitpid(pid, 0)
+  server.socket.close()
+
+
+def _get_together(*urls):
+  # Sends the requests at once; returns their statuses and the seconds until
+  # the last one finished
+  statuses = []
+
+  def get(url):
+    with urllib.request.urlopen(url, timeout=10) as response:
+      statuses.append(response.status)
+
+  threads = [threading.Thread(target=get, args=(url,)) for url in urls]
+  started = time.perf_counter()
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  return statuses, time.perf_counter() - started
+
+
+@pytest.mark.parametrize('threads', [1, 2])
+def test_worker_threads_overlap_slow_requests(app, catalog, monkeypatch, threads):
+  catalog(venues=3, artists=3, shows=10)
+  venue_areas = __import__('app').venue_areas
+
+  def slow_venue_areas(*args, **kwargs):
+    # Stands in for a slow query; the worker forked below inherits it
+    time.sleep(SLOW_SECONDS)
+    return venue_areas(*args, **kwargs)
+
+  monkeypatch.setattr('app.venue_areas', slow_venue_areas)
+  server, url = _start(app, SERVER_THREADS=threads)
+  try:
+    _get_together(url + '/')
+    # Different pages, so neither is served from the other's cache entry
+    statuses, elapsed = _get_together(url + '/venues?page=1', url + '/venues?page=2')
+  finally:
+    _stop(server)
+
+  assert statuses == [200, 200]
+  if threads == 1:
+    assert elapsed >= 2 * SLOW_SECONDS
+  else:
+    assert elapsed < 1.5 * SLOW_SECONDS
+
+
+
+def test_worker_recycles_after_max_requests_and_is_replaced(app, catalog):
+  catalog(venues=1, artists=1, shows=0)
+  server, url = _start(app, SERVER_THREADS=1, SERVER_MAX_REQUESTS=2, SERVER_MAX_REQUESTS_JITTER=0)
+  try:
+    first, = server.workers
+    for path in ('/', '/venues'):
+      assert _get_together(url + path)[0] == [200]
+
+    deadline = time.monotonic() + 10
+    while first in server.workers and time.monotonic() < deadline:
+      server._reap()
+      time.sleep(0.05)
+    assert len(server.workers) == 1 and first not in server.workers
+    assert _get_together(url + '/')[0] == [200]
+  finally:
+    _stop(server)
+
+
+def _children(pid):
+  with open('/proc/%d/task/%d/children' % (pid, pid)) as children:
+    return {int(child) for child in children.read().split()}
+
+
+def _wait_for(condition, timeout=20):
+  deadline = time.monotonic() + timeout
+  while not condition():
+    assert time.monotonic() < deadline
+    time.sleep(0.1)
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/task'), reason='lists worker processes through /proc')
+def test_hup_reloads_onto_new_workers_without_dropping_the_socket(app, catalog):
+  catalog(venues=1, artists=1, shows=0)
+  with socket.socket() as probe:
+    probe.bind(('127.0.0.1', 0))
+    port = probe.getsockname()[1]
+  env = dict(os.environ, DATABASE_URL=app.config['SQLALCHEMY_DATABASE_URI'], HOST='127.0.0.1', PORT=str(port),
+    WEB_CONCURRENCY='2', SERVER_THREADS='1')
+  root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  master = subprocess.Popen([sys.executable, 'server.py'], cwd=root, env=env,
+    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+  url = 'http://127.0.0.1:%d/' % port
+
+  def serving():
+    try:
+      with urllib.request.urlopen(url, timeout=10) as response:
+        return response.status == 200
+    except OSError:
+      return False
+
+  try:
+    _wait_for(lambda: serving() and len(_children(master.pid)) == 2)
+    old = _children(master.pid)
+
+    master.send_signal(signal.SIGHUP)
+    # The master re-executes in place, keeping its pid and the socket, and
+    # retires the old workers once the new ones are up
+    _wait_for(lambda: len(_children(master.pid)) == 2 and not _children(master.pid) & old)
+    assert serving()
+    assert master.poll() is None
+  finally:
+    master.terminate()
+    master.wait(timeout=30)
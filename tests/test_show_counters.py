@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+
+from app import db
+from models import Venue, Artist
+import counters
+from queries import venue_detail, artist_detail
+import scheduling
+
+
+def test_detail_splits_shows_at_the_counter_watermark(app, client):
+  now = datetime.now().replace(microsecond=0)
+  with app.app_context():
+    db.session.add_all([Venue(id=1, name='Venue'), Artist(id=1, name='Artist')])
+    db.session.commit()
+    counters.rebuild(now - timedelta(days=1))
+    # Started since the last roll, so still counted as upcoming
+    scheduling.book_show(1, 1, now - timedelta(hours=12))
+    scheduling.book_show(1, 1, now - timedelta(days=3))
+    db.session.commit()
+    db.session.remove()
+
+  for path in ('/api/v1/venues/1', '/api/v1/artists/1'):
+    detail = client.get(path).get_json()
+    assert detail['upcoming_shows_count'] == len(detail['upcoming_shows']) == 1
+    assert detail['past_shows_count'] == len(detail['past_shows']) == 1
+
+  with app.app_context():
+    counters.roll(now)
+  detail = client.get('/api/v1/venues/1').get_json()
+  assert detail['upcoming_shows_count'] == len(detail['upcoming_shows']) == 0
+  assert detail['past_shows_count'] == len(detail['past_shows']) == 2
+
+
+def test_detail_page_lists_match_its_totals(app, client, catalog):
+  catalog(venues=5, artists=5, shows=60)
+  with app.app_context():
+    counters.rebuild(datetime.now() - timedelta(days=30))
+
+  response = client.get('/venues/1')
+  assert response.status_code == 200
+  assert response.headers['X-Query-Count'] == '2'
+  detail = client.get('/api/v1/venues/1').get_json()
+  assert detail['upcoming_shows_count'] == len(detail['upcoming_shows'])
+
+
+def test_requests_roll_stale_counters_as_the_clock_moves(app, client, monkeypatch):
+  started = datetime.now().replace(microsecond=0)
+  with app.app_context():
+    db.session.add_all([Venue(id=1, name='Venue'), Artist(id=1, name='Artist')])
+    db.session.commit()
+    counters.rebuild(started)
+    scheduling.book_show(1, 1, started + timedelta(hours=1))
+    db.session.commit()
+    db.session.remove()
+
+  class Clock(datetime):
+    moved_to = started
+
+    @classmethod
+    def now(cls, tz=None):
+      return cls.moved_to
+
+  monkeypatch.setattr(counters, 'datetime', Clock)
+  monkeypatch.setattr(counters, '_checked_at', None)
+  app.config['COUNTER_ROLL_INTERVAL'] = 60
+  try:
+    detail = client.get('/api/v1/venues/1').get_json()
+    assert (detail['upcoming_shows_count'], detail['past_shows_count']) == (1, 0)
+
+    Clock.moved_to = started + timedelta(hours=2)
+    for path in ('/api/v1/venues/1', '/api/v1/artists/1'):
+      detail = client.get(path).get_json()
+      assert detail['upcoming_shows_count'] == len(detail['upcoming_shows']) == 0
+      assert detail['past_shows_count'] == len(detail['past_shows']) == 1
+  finally:
+    app.config['COUNTER_ROLL_INTERVAL'] = 0
+
+
+def test_detail_keeps_the_nearest_shows_of_each_section(app):
+  now = datetime.now().replace(microsecond=0)
+  with app.app_context():
+    db.session.add_all([Venue(id=1, name='Venue'), Venue(id=2, name='Empty'),
+      Artist(id=1, name='Artist', image_link='http://example.com/a.png')])
+    db.session.commit()
+    counters.rebuild(now)
+    days = (-5, -1, -3, 2, 1, 4, 3)
+    for day in days:
+      scheduling.book_show(1, 1, now + timedelta(days=day))
+    db.session.commit()
+
+    for detail, key in ((venue_detail(1, past_limit=2, upcoming_limit=3), 'artist'),
+                        (artist_detail(1, past_limit=2, upcoming_limit=3), 'venue')):
+      assert [show['start_time'] for show in detail['upcoming_shows']] == [now + timedelta(days=day) for day in (1, 2, 3)]
+      assert [show['start_time'] for show in detail['past_shows']] == [now + timedelta(days=day) for day in (-1, -3)]
+      assert (detail['upcoming_shows_count'], detail['past_shows_count']) == (4, 3)
+      assert detail['upcoming_shows'][0][key + '_id'] == 1
+    assert detail['upcoming_shows'][0]['venue_name'] == 'Venue'
+
+    unlimited = venue_detail(1)
+    assert len(unlimited['upcoming_shows']) == 4 and len(unlimited['past_shows']) == 3
+    assert unlimited['upcoming_shows'][0]['artist_image_link'] == 'http://example.com/a.png'
+
+    empty = venue_detail(2)
+    assert (empty['entity'].name, empty['upcoming_shows'], empty['past_shows']) == ('Empty', [], [])
+    assert venue_detail(3) is None
+    db.session.remove()
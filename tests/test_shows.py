@@ -0,0 +1,117 @@
+import gzip
+import io
+from datetime import datetime, timedelta
+
+from app import db
+from models import Venue, Artist, Show
+from queries import show_page, encode_cursor, decode_cursor
+import exporter
+import importer
+import scheduling
+
+
+def _setup(app):
+  with app.app_context():
+    db.session.add_all([Venue(id=1, name='Venue'), Artist(id=1, name='Artist'), Artist(id=2, name='Other')])
+    db.session.commit()
+    db.session.remove()
+
+
+def _shows(app):
+  with app.app_context():
+    shows = sorted(db.session.query(Show.venue_id, Show.artist_id, Show.start_time, Show.duration))
+    db.session.remove()
+  return shows
+
+
+def test_create_show_keeps_duration_and_rejects_bad_ones(app, client):
+  _setup(app)
+  client.post('/shows/create', data={"venue_id": '1', "artist_id": '1', "start_time": '2099-01-01 20:00:00',
+    "duration": '45'})
+  client.post('/shows/create', data={"venue_id": '1', "artist_id": '1', "start_time": '2099-01-02 20:00:00',
+    "duration": '0'})
+  client.post('/shows/create', data={"venue_id": '1', "artist_id": '1', "start_time": '2099-01-03 20:00:00'})
+
+  assert [(show[2].day, show[3]) for show in _shows(app)] == [(1, 45), (3, 120)]
+
+
+def test_create_show_rejects_overlapping_bookings(app, client):
+  _setup(app)
+  client.post('/shows/create', data={"venue_id": '1', "artist_id": '1', "start_time": '2099-01-01 20:00:00'})
+  response = client.post('/shows/create', data={"venue_id": '1', "artist_id": '2',
+    "start_time": '2099-01-01 21:00:00'})
+
+  assert b'could not be listed' in response.data
+  assert len(_shows(app)) == 1
+
+
+def test_show_export_loads_back_unchanged(app, client):
+  _setup(app)
+  for day, duration in ((1, 30), (2, 120), (3, 240)):
+    client.post('/shows/create', data={"venue_id": '1', "artist_id": '1',
+      "start_time": '2099-01-0%d 20:00:00' % day, "duration": str(duration)})
+  exported = _shows(app)
+
+  with app.app_context():
+    text = gzip.decompress(b''.join(exporter.export_csv('shows'))).decode('utf-8')
+    Show.query.delete()
+    db.session.commit()
+    report = importer.import_rows('shows', importer.read_rows(io.StringIO(text), 'csv'))
+    db.session.remove()
+
+  assert report['inserted'] == 3
+  assert _shows(app) == exported
+
+
+def test_show_export_writes_times_the_importer_reads(app):
+  _setup(app)
+  with app.app_context():
+    scheduling.book_show(1, 1, datetime(2099, 1, 1, 20, 0, 0, 123456))
+    db.session.commit()
+    text = gzip.decompress(b''.join(exporter.export_csv('shows'))).decode('utf-8')
+    assert ',2099-01-01 20:00:00,' in text
+
+    Show.query.delete()
+    db.session.commit()
+    rows = [(1, {"venue_id": '1', "artist_id": '1', "start_time": '2099-01-01 20:00:00.123456'})]
+    assert importer.import_rows('shows', importer.read_rows(io.StringIO(text), 'csv'))['inserted'] == 1
+    # parsed, and only turned away as a clash with the show just loaded
+    report = importer.import_rows('shows', rows)
+    assert 'start_time' not in report['errors'][0]['errors']
+    assert 'venue_id' in report['errors'][0]['errors']
+    db.session.remove()
+
+
+def test_show_pages_walk_both_ways_over_tied_start_times(app):
+  _setup(app)
+  first = datetime(2099, 1, 1, 20, 0)
+  with app.app_context():
+    for day in (0, 1, 1, 1, 2, 3, 3):
+      start_time = first + timedelta(days=day)
+      db.session.add(Show(venue_id=1, artist_id=1, start_time=start_time, end_time=start_time + timedelta(hours=2)))
+    db.session.commit()
+    expected = [show_id for show_id, in db.session.query(Show.id).order_by(Show.start_time, Show.id)]
+
+    pages = [show_page(per_page=3)]
+    while pages[-1]['next']:
+      pages.append(show_page(after=decode_cursor(pages[-1]['next']), per_page=3))
+    assert [[show['id'] for show in page['shows']] for page in pages] == [expected[:3], expected[3:6], expected[6:]]
+    assert pages[0]['prev'] is None
+
+    back = show_page(before=decode_cursor(pages[-1]['prev']), per_page=3)
+    assert back['shows'] == pages[1]['shows']
+    assert (back['prev'], back['next']) == (pages[1]['prev'], pages[1]['next'])
+    db.session.remove()
+
+  tied = first + timedelta(days=1)
+  assert decode_cursor(encode_cursor(tied, 12)) == (tied, 12)
+
+
+def test_malformed_show_cursors_fall_back_to_the_first_page(client, catalog):
+  catalog(venues=3, artists=3, shows=40)
+  listing = client.get('/shows')
+  for cursor in ('garbage', '2099-01-01T20:00:00.000000~x', '~', ''):
+    for direction in ('after', 'before'):
+      response = client.get('/shows', query_string={direction: cursor})
+      assert response.status_code == 200
+      assert response.data == listing.data
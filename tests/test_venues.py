@@ -0,0 +1,111 @@
+import re
+from datetime import datetime
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from app import db, profiler
+from models import Venue, Artist, Show, normalize_genres
+from queries import venue_areas, has_genre, find_venues_near, near_args
+import geo
+
+
+@pytest.mark.parametrize('venues', [10, 500])
+def test_venues_query_count_does_not_grow_with_venues(client, catalog, venues):
+  catalog(venues=venues, artists=50, shows=venues * 4)
+
+  # One query for the ETag version, one for the areas and their counts
+  with profiler.max_queries(2):
+    response = client.get('/venues')
+
+  assert response.status_code == 200
+  assert response.headers['X-Query-Count'] == '2'
+  assert len(set(re.findall(rb'href="/venues/(\d+)"', response.data))) == venues
+
+
+def test_venue_areas_group_venues_with_upcoming_counts(app, catalog):
+  catalog(venues=40, artists=10, shows=300, cities=4)
+
+  with app.app_context():
+    areas = venue_areas()
+    now = datetime.now()
+    expected = {}
+    for venue in Venue.query:
+      expected[venue.id] = (venue.city, venue.state, Show.query.filter(
+        Show.venue_id == venue.id, Show.start_time > now
+      ).count())
+    db.session.remove()
+
+  assert len(areas) == len({(city, state) for city, state, _ in expected.values()})
+  listed = {}
+  for area in areas:
+    for venue in area['venues']:
+      listed[venue['id']] = (area['city'], area['state'], venue['num_upcoming_shows'])
+  assert listed == expected
+
+
+def test_calendar_turns_away_months_out_of_range(client, catalog):
+  catalog(venues=1, artists=1, shows=0)
+  for month in ('0001-01', '9999-12', '2024-13', 'May'):
+    assert client.get('/venues/1/calendar?month=%s' % month).status_code == 400
+  for month in ('0002-01', '2024-02', '9998-12'):
+    assert client.get('/venues/1/calendar?month=%s' % month).status_code == 200
+
+
+def test_genres_are_stored_in_their_canonical_spelling():
+  assert normalize_genres([' jazz ', 'JAZZ', 'hip-hop', 'rock  N roll', 'Sea Shanty', '']) == [
+    'Jazz', 'Hip-Hop', 'Rock n Roll', 'Sea Shanty'
+  ]
+  assert normalize_genres(None) == []
+
+
+def test_listings_filter_by_whole_genres(app, client):
+  with app.app_context():
+    db.session.add_all([
+      Venue(id=1, name='Jazz Club', city='San Francisco', state='CA', genres=['Jazz', 'Blues']),
+      Venue(id=2, name='Fusion Bar', city='San Francisco', state='CA', genres=['Jazz Fusion']),
+      Artist(id=1, name='Trio', genres=['Jazz']),
+      Artist(id=2, name='Band', genres=['R&B']),
+    ])
+    db.session.commit()
+    assert [venue.id for venue in Venue.query.filter(has_genre(Venue.genres, 'Jazz'))] == [1]
+    db.session.remove()
+
+  listed = client.get('/venues?genre=jazz').data
+  assert b'/venues/1"' in listed and b'/venues/2"' not in listed
+  listed = client.get('/artists?genre=r%26b').data
+  assert b'/artists/2"' in listed and b'/artists/1"' not in listed
+  listed = client.get('/venues?genre=Fusion').data
+  assert b'/venues/1"' not in listed and b'/venues/2"' not in listed
+
+
+def test_venues_near_keeps_the_circle_not_its_bounding_box(app):
+  lat, lon = 37.7749, -122.4194
+  with app.app_context():
+    db.session.add_all([
+      Venue(id=1, name='Here', latitude=lat, longitude=lon),
+      Venue(id=2, name='North', latitude=lat + 0.08, longitude=lon),
+      # inside the 10 km box, but in its corner beyond the circle
+      Venue(id=3, name='Corner', latitude=lat + 0.08, longitude=lon + 0.1),
+      Venue(id=4, name='Far', latitude=lat + 0.2, longitude=lon),
+      Venue(id=5, name='Nowhere'),
+      Venue(id=6, name='Also here', latitude=lat, longitude=lon),
+    ])
+    db.session.commit()
+
+    near = find_venues_near(lat, lon, 10)
+    assert [venue['id'] for venue in near] == [1, 6, 2]
+    assert near[2]['distance_km'] == round(geo.distance_km(lat, lon, lat + 0.08, lon), 1)
+    assert 8.8 < near[2]['distance_km'] < 9
+    assert geo.distance_km(lat, lon, lat + 0.08, lon + 0.1) > 10
+    assert [venue['id'] for venue in find_venues_near(lat, lon, 10, limit=2)] == [1, 6]
+    assert [venue['id'] for venue in find_venues_near(lat, lon, 0)] == [1, 6]
+    db.session.remove()
+
+
+def test_near_args_clamp_the_radius_and_reject_bad_points():
+  assert near_args(MultiDict({"lat": '10', "lon": '20'}), 25, 200) == (10.0, 20.0, 25)
+  assert near_args(MultiDict({"lat": '10', "lon": '20', "radius": '5000'}), 25, 200) == (10.0, 20.0, 200)
+  assert near_args(MultiDict({"lat": '10', "lon": '20', "radius": '-1'}), 25, 200) == (10.0, 20.0, 0)
+  assert near_args(MultiDict({"lat": '91', "lon": '20'}), 25, 200) is None
+  assert near_args(MultiDict({"lat": 'x', "lon": '20'}), 25, 200) is None